@@ -0,0 +1,125 @@
+# Admission control for parse requests. Every parse is charged an estimate of the
+# memory it will need (a multiple of its upload size) against a budget shared by
+# all worker processes, plus one of a fixed number of parse slots. A request that
+# doesn't fit waits in a bounded queue; when the queue is full it is turned away
+# at once with 429, and when its wait times out with 503, both with Retry-After.
+#
+# The shared counters live in anonymous shared memory created at import, so with
+# gunicorn's preload_app (see gunicorn.conf.py) every forked worker draws on the
+# same budget. Without preloading each worker process has a budget of its own.
+# Each running parse holds a slot recording its process id, so the share of a
+# worker that dies mid-parse can be reclaimed (gunicorn's child_exit hook).
+
+import os
+import time
+import threading
+import multiprocessing
+
+from ..config import settings
+
+
+class Overloaded(Exception):
+    def __init__(self, status: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's share of the budget; release() gives it back (more than once is harmless)."""
+
+    def __init__(self, controller, slot: int):
+        self._controller = controller
+        self.slot = slot
+        self.transferred = False
+        self._released = False
+        self._lock = threading.Lock()
+
+    def transfer(self):
+        """Hands the ticket to whoever outlives the request (a background job); returns its release()."""
+        self.transferred = True
+        return self.release
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release(self.slot)
+
+
+class AdmissionController:
+    def __init__(self, memory_bytes: int, max_parses: int, bytes_factor: float, queue_size: int,
+                 queue_timeout: float, retry_after: int):
+        self.memory_bytes = memory_bytes
+        self.max_parses = max_parses
+        self.bytes_factor = bytes_factor
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._condition = multiprocessing.Condition()
+        # Shared memory: slot i is (pid, cost) at [2i, 2i+1], pid 0 when free.
+        self._slots = multiprocessing.RawArray('q', 2 * max_parses)
+        self._waiting = multiprocessing.RawValue('q', 0)
+
+    def cost(self, content_length) -> int:
+        """Estimated peak memory of parsing an upload of `content_length` bytes (None if unknown)."""
+        if not content_length:
+            return self.memory_bytes // self.max_parses
+        # A parse bigger than the whole budget is still admitted, alone.
+        return min(int(content_length * self.bytes_factor), self.memory_bytes)
+
+    def _free_slot(self, cost: int):
+        """A free slot if a parse costing `cost` fits the budget now, else None."""
+        slots = self._slots
+        used = sum(slots[1::2])
+        if used + cost > self.memory_bytes:
+            return None
+        for slot in range(self.max_parses):
+            if not slots[2 * slot]:
+                return slot
+        return None
+
+    def acquire(self, cost: int) -> Ticket:
+        """Admits a request costing `cost` bytes, waiting in the queue if need be. Raises Overloaded."""
+        with self._condition:
+            slot = self._free_slot(cost)
+            if slot is None:
+                if self._waiting.value >= self.queue_size:
+                    raise Overloaded(429, "Too many parses in progress; try again later.", self.retry_after)
+                self._waiting.value += 1
+                try:
+                    deadline = time.monotonic() + self.queue_timeout
+                    while slot is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Overloaded(503, "Timed out waiting for parse capacity; try again later.",
+                                             self.retry_after)
+                        self._condition.wait(remaining)
+                        slot = self._free_slot(cost)
+                finally:
+                    self._waiting.value -= 1
+            self._slots[2 * slot] = os.getpid()
+            self._slots[2 * slot + 1] = cost
+        return Ticket(self, slot)
+
+    def _release(self, slot: int):
+        with self._condition:
+            self._slots[2 * slot] = 0
+            self._slots[2 * slot + 1] = 0
+            self._condition.notify_all()
+
+    def reclaim(self, pid: int):
+        """Frees the slots of a worker process that exited without releasing them."""
+        with self._condition:
+            for slot in range(self.max_parses):
+                if self._slots[2 * slot] == pid:
+                    self._slots[2 * slot] = 0
+                    self._slots[2 * slot + 1] = 0
+            self._condition.notify_all()
+
+
+admission = AdmissionController(settings.ADMISSION_MEMORY_BYTES, settings.ADMISSION_MAX_PARSES,
+                                settings.ADMISSION_BYTES_FACTOR, settings.ADMISSION_QUEUE_SIZE,
+                                settings.ADMISSION_QUEUE_TIMEOUT, settings.ADMISSION_RETRY_AFTER) \
+    if settings.ADMISSION_ENABLED else None
@@ -1,38 +1,434 @@
 # This file is now much simpler. It only has one endpoint.
 
-from flask import Blueprint, request, jsonify
-from ..logic.tasks import parse_file_and_get_results
+import os
+import hmac
+import json
+import time
+
+from flask import Blueprint, Response, request, jsonify, url_for, send_file, make_response
+from ..logic.tasks import parse_upload, parse_session_upload
+from ..logic.jobs import job_manager
+from ..logic.store import result_store
+from ..logic.sessions import session_store, parse_cursor
+from ..logic.encoding import (NDJSON_MIMETYPE, COLUMNAR_MIMETYPE, MSGPACK_MIMETYPE, MSGPACK_AVAILABLE,
+                              CONTENT_ENCODINGS, iter_ndjson, iter_json, iter_columnar, iter_msgpack,
+                              iter_compressed)
+from ..logic.profiling import profile_call, profile_path, load_summary
+from ..parsers.filters import MessageFilter
+from ..parsers.near_duplicates import NearDuplicateFolder
+from ..config import settings
+from ..metrics import metrics
+from .uploads import keep_upload
+from .admission import admission, Overloaded
 
 # We no longer have a url_prefix, the endpoint will be directly at /parse
 api_blueprint = Blueprint('api', __name__)
 
 
+_FORMATS = {'json': 'application/json', 'ndjson': NDJSON_MIMETYPE, 'columnar': COLUMNAR_MIMETYPE,
+            'msgpack': MSGPACK_MIMETYPE}
+_STREAMS = {'ndjson': iter_ndjson, 'columnar': iter_columnar, 'msgpack': iter_msgpack}
+
+# Request bodies up to this size are read and dropped before an early error response.
+_DISCARD_MAX_BYTES = 4 * 1024 * 1024
+
+
+def _response_format() -> str:
+    """?format=json|ndjson|columnar|msgpack, or the format the Accept header prefers (JSON by default)."""
+    if request.args.get('format'):
+        requested = request.args.get('format')
+        return requested if requested in _FORMATS else 'json'
+    offered = [name for name in _FORMATS if name != 'msgpack' or MSGPACK_AVAILABLE]
+    best = request.accept_mimetypes.best_match([_FORMATS[name] for name in offered], default='application/json')
+    return next(name for name in offered if _FORMATS[name] == best)
+
+
+def _profiling_authorized() -> bool:
+    """True if the request carries the admin X-Profile-Token (profiling is off without a configured token)."""
+    token = request.headers.get('X-Profile-Token', '')
+    return bool(settings.PROFILE_TOKEN) and hmac.compare_digest(token, settings.PROFILE_TOKEN)
+
+
+def _timed_chunks(chunks):
+    # Only the time spent producing chunks counts, not time waiting on the client.
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - start
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        metrics.observe('serialize', elapsed)
+
+
+def _format_unavailable():
+    """A 406 response if the requested format can't be produced here (MessagePack without msgpack), else None."""
+    if _response_format() != 'msgpack' or MSGPACK_AVAILABLE:
+        return None
+    response = jsonify({"error": "MessagePack responses are not available on this server"})
+    response.status_code = 406
+    return _discard_body(response)
+
+
+def _result_response(result_data: dict, release: bool = False) -> Response:
+    """
+    The result in the negotiated format (_response_format()), compressed with the
+    best Content-Encoding the client accepts. Message lists are encoded, and
+    compressed, a chunk at a time as they are sent.
+    """
+    if "messages" not in result_data:
+        with metrics.timed('serialize'):
+            return jsonify(result_data)
+    unavailable = _format_unavailable()
+    if unavailable:
+        return unavailable
+    response_format = _response_format()
+    chunk_size = settings.NDJSON_CHUNK_SIZE
+    if response_format == 'json':
+        chunks = iter_json(result_data, chunk_size=chunk_size, release=release)
+    else:
+        chunks = _STREAMS[response_format](result_data["messages"], result_data["statistics"],
+                                           chunk_size=chunk_size, release=release)
+    encoding = request.accept_encodings.best_match(CONTENT_ENCODINGS)
+    if encoding:
+        level = settings.GZIP_LEVEL if encoding == 'gzip' else settings.ZSTD_LEVEL
+        chunks = iter_compressed(chunks, encoding, level)
+    response = Response(_timed_chunks(chunks), status=200, mimetype=_FORMATS[response_format])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+def _flag(name: str) -> bool:
+    """A boolean query string or form parameter (?store=1, stats_only=true)."""
+    return (request.args.get(name) or request.form.get(name, '')).lower() in ('1', 'true', 'yes')
+
+
+def _stored_result(summary: dict) -> dict:
+    result_id = summary["result_id"]
+    return dict(summary,
+                result_url=url_for('api.stored_result', result_id=result_id),
+                statistics_url=url_for('api.stored_statistics', result_id=result_id),
+                messages_url=url_for('api.stored_messages', result_id=result_id))
+
+
+def _discard_body(response: Response) -> Response:
+    """Drops the request body before an early error `response`; returns the response."""
+    # Most clients send the whole body before reading the response; answering without
+    # reading it would reset the connection and the client would never see the status.
+    # A body too big to be worth reading (or of unknown size) is left unread and its
+    # connection closed after the response (gunicorn: post_request in gunicorn.conf.py).
+    length = request.content_length
+    if length is None or length > _DISCARD_MAX_BYTES:
+        response.headers['Connection'] = 'close'
+        request.environ['parser.close_connection'] = True
+        return response
+    stream = request.stream
+    while stream.read(1024 * 1024):
+        pass
+    return response
+
+
 @api_blueprint.route("/parse", methods=['POST'])
 def parse_endpoint():
     """
     This single endpoint receives a file, calls the synchronous parsing function,
     and returns the complete result in the response.
-    The /status endpoint is no longer needed.
+    With ?mode=async (or a `mode=async` form field) the parse runs as a background
+    job instead: the response is a 202 with the job id, and the client polls
+    /api/jobs/<job_id> and fetches /api/jobs/<job_id>/result.
+    ?format=ndjson (or Accept: application/x-ndjson) streams the messages as
+    newline-delimited JSON, with the statistics as a trailing record;
+    ?format=columnar (application/vnd.parser.columnar+x-ndjson) as blocks of
+    columns with dictionary-coded senders and sources and epoch timestamps, and
+    ?format=msgpack (application/x-msgpack) as the same blocks in MessagePack.
+    Responses are gzip or zstd compressed for clients that send Accept-Encoding.
+    A synchronous parse sent with a valid X-Profile-Token header runs under the
+    profiler; the X-Profile-Id response header names the stored profile.
+    Optional filters (query string or form): since/until (ISO 8601, inclusive),
+    sender (repeatable), platform (e.g. telegram,facebook) and contains.
+    With ?store=1 the result is saved under a result id instead of returned (201,
+    or a job whose status carries the result_id), to be paged through
+    /api/results/<result_id>/messages.
+    With ?stats_only=1 only the statistics are returned, extended with counts per
+    sender, platform, day and hour; the messages are counted but never collected.
+    With ?near_duplicates=1 messages that nearly repeat an earlier one from the same
+    sender (near_duplicate_threshold, default 0.8 similarity) within
+    near_duplicate_window seconds (default 60) are folded into it.
+    Parses are admitted against a memory budget estimated from Content-Length
+    (see admission.py); when it is exhausted the answer is 429 or 503 with Retry-After.
     """
-    if 'file' not in request.files:
+    unavailable = _format_unavailable()
+    if unavailable:
+        return unavailable
+    return _admitted(_parse_request)
+
+
+def _admitted(handle, *args):
+    """Runs handle(ticket, *args) once admission control lets the request in, and makes its response."""
+    ticket = None
+    if admission:
+        try:
+            ticket = admission.acquire(admission.cost(request.content_length))
+        except Overloaded as e:
+            metrics.inc('requests_rejected')
+            response = jsonify({"error": str(e)})
+            response.status_code = e.status
+            response.headers['Retry-After'] = str(e.retry_after)
+            return _discard_body(response)
+    try:
+        response = make_response(handle(ticket, *args))
+    except BaseException:
+        if ticket:
+            ticket.release()
+        raise
+    if ticket and not ticket.transferred:
+        # Held until the response is sent: a streamed result is still in memory until then.
+        response.call_on_close(ticket.release)
+    return response
+
+
+def _parse_request(ticket):
+    # Reading the form streams the body into a spooled file (see uploads.py).
+    with metrics.timed('upload'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({"error": "No file part"}), 400
 
-    file = request.files['file']
+    file = files['file']
 
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
+    try:
+        filters = MessageFilter.from_params(request.values)
+        near_duplicates = NearDuplicateFolder.from_params(request.values) if _flag('near_duplicates') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if file:
-        file_content = file.read()
+        upload_path = keep_upload(file)
         filename = file.filename
+        stats_only = _flag('stats_only')
+
+        if (request.args.get('mode') or request.form.get('mode')) == 'async':
+            job = job_manager.submit(upload_path, filename, filters, store=_flag('store') and not stats_only,
+                                     stats_only=stats_only, on_done=ticket.transfer() if ticket else None,
+                                     near_duplicates=near_duplicates)
+            return jsonify({
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": url_for('api.job_status', job_id=job.id),
+                "result_url": url_for('api.job_result', job_id=job.id),
+            }), 202
 
         # This is now a direct, blocking call. The request will wait here
         # until the parsing is finished.
-        result_data = parse_file_and_get_results(file_content, filename)
+        profile_id = None
+        try:
+            if _profiling_authorized():
+                # Serial and uncached, so all of the work happens on this thread where the profiler sees it.
+                result_data, profile_id = profile_call(filename, parse_upload, upload_path, filename,
+                                                       workers=1, use_cache=False, filters=filters,
+                                                       stats_only=stats_only, near_duplicates=near_duplicates)
+            else:
+                result_data = parse_upload(upload_path, filename, filters=filters, stats_only=stats_only,
+                                           near_duplicates=near_duplicates)
+        finally:
+            os.remove(upload_path)
 
         if "error" in result_data:
-            return jsonify(result_data), 500
+            response = jsonify(result_data)
+            response.status_code = 500
+        elif stats_only:
+            response = _result_response(result_data)
+        elif _flag('store'):
+            result_id = result_store.save(result_data)
+            response = jsonify(_stored_result(result_store.summary(result_id)))
+            response.status_code = 201
+        else:
+            # Nothing else holds this result, so messages can be freed as they are sent.
+            response = _result_response(result_data, release=True)
+
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+        return response
+
+
+@api_blueprint.route("/jobs/<job_id>", methods=['GET'])
+def job_status(job_id):
+    """Status and progress of a background parse job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_status()), 200
+
 
-        # Return the final, complete JSON data.
-        return jsonify(result_data), 200
+@api_blueprint.route("/jobs/<job_id>/result", methods=['GET'])
+def job_result(job_id):
+    """The finished result of a background parse job, in the same shape as /parse."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if job.status == 'failed':
+        return jsonify({"error": job.error}), 500
+    if job.status != 'done':
+        return jsonify(job.to_status()), 202
+    if job.store:
+        summary = result_store.summary(job.result_id)
+        if summary is None:
+            return jsonify({"error": "Unknown or expired result"}), 404
+        return jsonify(_stored_result(summary)), 200
+    result = job_manager.result(job)
+    if result is None:
+        return jsonify({"error": "Unknown or expired result"}), 404
+    # Loaded for this response alone, so messages can be freed as they are sent.
+    return _result_response(result, release=True)
 
+
+@api_blueprint.route("/results/<result_id>", methods=['GET'])
+def stored_result(result_id):
+    """Statistics, message count and expiry of a stored result."""
+    summary = result_store.summary(result_id)
+    if summary is None:
+        return jsonify({"error": "Unknown or expired result"}), 404
+    return jsonify(_stored_result(summary)), 200
+
+
+@api_blueprint.route("/results/<result_id>/statistics", methods=['GET'])
+def stored_statistics(result_id):
+    """Just the statistics block of a stored result."""
+    summary = result_store.summary(result_id)
+    if summary is None:
+        return jsonify({"error": "Unknown or expired result"}), 404
+    return jsonify({"statistics": summary["statistics"]}), 200
+
+
+@api_blueprint.route("/results/<result_id>/messages", methods=['GET'])
+def stored_messages(result_id):
+    """
+    One page of a stored result's messages in timestamp order: ?limit= messages
+    (default RESULT_PAGE_SIZE) from ?cursor= on. Follow next_cursor until it is null.
+    """
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = int(request.args.get('limit', settings.RESULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "cursor and limit must be integers"}), 400
+    if cursor < 0 or limit < 1:
+        return jsonify({"error": "cursor must be >= 0 and limit >= 1"}), 400
+    page = result_store.page(result_id, cursor, min(limit, settings.RESULT_MAX_PAGE_SIZE))
+    if page is None:
+        return jsonify({"error": "Unknown or expired result"}), 404
+    rows, next_cursor = page
+    # The rows are stored already encoded, so the page is spliced together rather than re-serialized.
+    body = f'{{"messages":[{",".join(rows)}],"next_cursor":{"null" if next_cursor is None else next_cursor}}}'
+    return Response(body, status=200, mimetype='application/json')
+
+
+def _session_urls(session_id: str) -> dict:
+    return {"session_url": url_for('api.session_summary', session_id=session_id),
+            "upload_url": url_for('api.session_upload', session_id=session_id),
+            "messages_url": url_for('api.session_messages', session_id=session_id)}
+
+
+@api_blueprint.route("/sessions", methods=['POST'])
+def create_session():
+    """
+    Starts an append session: each export uploaded to its upload_url is merged into
+    the session's timeline, and only the messages not seen before are parsed past
+    their timestamps, sorted and returned (see sessions.py).
+    """
+    session_id = session_store.create()
+    return jsonify(dict(session_id=session_id, **_session_urls(session_id))), 201
+
+
+@api_blueprint.route("/sessions/<session_id>", methods=['GET'])
+def session_summary(session_id):
+    """Message and upload counts, time span and expiry of a session."""
+    summary = session_store.summary(session_id)
+    if summary is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return jsonify(dict(summary, **_session_urls(session_id))), 200
+
+
+@api_blueprint.route("/sessions/<session_id>/uploads", methods=['POST'])
+def session_upload(session_id):
+    """
+    Merges an uploaded export into the session. The response has the same shape as
+    /parse (in any of its formats) but holds only the messages this upload added;
+    the statistics carry range_url, the updated range of the timeline.
+    """
+    # Refused before the upload is merged, or its messages would never reach the client.
+    unavailable = _format_unavailable()
+    if unavailable:
+        return unavailable
+    return _admitted(_session_upload, session_id)
+
+
+def _session_upload(ticket, session_id):
+    with metrics.timed('upload'):
+        files = request.files
+    if 'file' not in files or files['file'].filename == '':
+        return jsonify({"error": "No file part"}), 400
+    file = files['file']
+    upload_path = keep_upload(file)
+    try:
+        result_data = parse_session_upload(upload_path, file.filename, session_id)
+    finally:
+        os.remove(upload_path)
+    if result_data is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    if "error" in result_data:
+        return jsonify(result_data), 500
+
+    statistics = result_data["statistics"]
+    if statistics["first_timestamp"]:
+        statistics["range_url"] = url_for('api.session_messages', session_id=session_id,
+                                          since=statistics["first_timestamp"], until=statistics["last_timestamp"])
+    return _result_response(result_data, release=True)
+
+
+@api_blueprint.route("/sessions/<session_id>/messages", methods=['GET'])
+def session_messages(session_id):
+    """
+    One page of a session's whole timeline in timestamp order: ?limit= messages
+    after ?cursor=, optionally within ?since= and ?until= (ISO 8601, inclusive).
+    Follow next_cursor until it is null.
+    """
+    try:
+        cursor = parse_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = int(request.args.get('limit', settings.RESULT_PAGE_SIZE))
+        bounds = MessageFilter.from_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid cursor, limit, since or until: {e}"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be >= 1"}), 400
+    page = session_store.page(session_id, cursor, min(limit, settings.RESULT_MAX_PAGE_SIZE),
+                              bounds.since, bounds.until)
+    if page is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    rows, next_cursor = page
+    body = f'{{"messages":[{",".join(rows)}],"next_cursor":{"null" if next_cursor is None else json.dumps(next_cursor)}}}'
+    return Response(body, status=200, mimetype='application/json')
+
+
+@api_blueprint.route("/profiles/<profile_id>", methods=['GET'])
+def profile_result(profile_id):
+    """
+    A stored request profile: wall time per parser module and the top functions,
+    or the raw cProfile dump with ?format=pstats. Needs the X-Profile-Token header.
+    """
+    if not _profiling_authorized():
+        return jsonify({"error": "Profiling is not enabled for this request"}), 403
+    summary = load_summary(profile_id)
+    if summary is None:
+        return jsonify({"error": "Unknown or expired profile"}), 404
+    if request.args.get('format') == 'pstats':
+        return send_file(profile_path(profile_id, 'pstats'), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'{profile_id}.pstats')
+    return jsonify(summary), 200
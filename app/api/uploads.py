@@ -0,0 +1,41 @@
+# Uploads are written straight from the request body to a file on disk and parsed
+# from there, so no copy of an upload is ever held in memory.
+
+import os
+import uuid
+import shutil
+import tempfile
+
+from flask import Request
+
+from ..config import settings
+
+
+class SpoolingRequest(Request):
+    """Request whose file parts are streamed into named temporary files in settings.UPLOAD_DIR."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug's default keeps small parts in memory and large ones in anonymous files;
+        # a named file can be handed to the parser (and its worker processes) by path.
+        return tempfile.NamedTemporaryFile('w+b', dir=settings.UPLOAD_DIR, suffix='.part')
+
+
+def keep_upload(file) -> str:
+    """
+    Returns the path of a file holding the upload `file`, which the caller owns
+    and must delete. The spooled part is hard-linked rather than copied, since
+    Werkzeug deletes it when the request ends.
+    """
+    path = os.path.join(settings.UPLOAD_DIR, f'{uuid.uuid4().hex}.upload')
+    spooled = getattr(file.stream, 'name', None)
+    if isinstance(spooled, str):
+        file.stream.flush()
+        try:
+            os.link(spooled, path)
+            return path
+        except OSError:
+            pass
+    file.stream.seek(0)
+    with open(path, 'wb') as out:
+        shutil.copyfileobj(file.stream, out, 1024 * 1024)
+    return path
@@ -0,0 +1,196 @@
+# Offline bulk parsing: every export under the given directories or globs is parsed
+# on a pool of worker processes into its own NDJSON file. Finished inputs are
+# recorded in a manifest, so an interrupted run picks up where it stopped.
+#
+#   python -m app.bulk /data/exports 'more/**/*.zip' --output-dir parsed --workers 8
+#   python -m app.bulk /data/exports --output-dir parsed      # again: resumes
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import hashlib
+import argparse
+import multiprocessing
+
+from .config import settings
+from .logic.tasks import parse_upload
+from .logic.encoding import iter_ndjson
+
+INPUT_EXTENSIONS = ('.zip', '.html', '.htm', '.json')
+
+
+def find_inputs(patterns: list, extensions=INPUT_EXTENSIONS) -> list:
+    """Files named by the arguments: directories are searched recursively, globs are expanded."""
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                for name in names:
+                    if name.lower().endswith(extensions):
+                        found.setdefault(os.path.abspath(os.path.join(root, name)), None)
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]:
+                if os.path.isfile(path):
+                    found.setdefault(os.path.abspath(path), None)
+    return sorted(found)
+
+
+def output_name(path: str) -> str:
+    """Per-input output file name; the path hash keeps same-named exports from different folders apart."""
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:10]
+    return f'{os.path.basename(path)}.{digest}.ndjson'
+
+
+def _fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class Manifest:
+    """
+    Append-only JSON-lines log of finished inputs. An input counts as done when its
+    latest record says so and the file has not changed since.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    self.records[record["input"]] = record
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, path: str) -> bool:
+        record = self.records.get(path)
+        if record is None or record["status"] != 'done':
+            return False
+        try:
+            return {"size": record["size"], "mtime_ns": record["mtime_ns"]} == _fingerprint(path)
+        except OSError:
+            return False
+
+    def record(self, record: dict):
+        self.records[record["input"]] = record
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def _init_worker(quiet: bool):
+    # Ctrl-C is handled by the parent, which terminates the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if quiet:
+        # The parser logs every file and member; thousands of inputs would drown the progress lines.
+        sys.stdout = open(os.devnull, 'w')
+
+
+def _parse_one(task: tuple) -> dict:
+    """Pool task: parses one input into its NDJSON file and returns its manifest record."""
+    path, output_path, use_cache = task
+    record = dict(input=path, output=output_path, size=0)
+    start = time.perf_counter()
+    try:
+        record.update(_fingerprint(path))
+        result = parse_upload(path, os.path.basename(path), workers=1, use_cache=use_cache)
+        if "error" in result:
+            record.update(status='failed', error=result["error"])
+        else:
+            # Written under a temporary name, so a half-written file is never taken for output.
+            tmp_path = output_path + '.part'
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter_ndjson(result["messages"], result["statistics"],
+                                         chunk_size=settings.NDJSON_CHUNK_SIZE, release=True):
+                    f.write(chunk)
+            os.replace(tmp_path, output_path)
+            record.update(status='done', messages=result["statistics"]["total_messages"])
+    except Exception as e:
+        # The input vanished, the output disk filled up...: this input failed, the run goes on.
+        record.update(status='failed', error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run(inputs: list, output_dir: str, workers: int, manifest_path: str = None, use_cache: bool = False,
+        quiet: bool = True, retry_failed: bool = False, max_tasks_per_child: int = 50) -> dict:
+    """Parses every input not already done according to the manifest. Returns the run's totals."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(manifest_path or os.path.join(output_dir, 'manifest.jsonl'))
+    pending = [path for path in inputs if not manifest.is_done(path)
+               and (retry_failed or manifest.records.get(path, {}).get("status") != 'failed')]
+    print(f"{len(inputs)} input(s): {len(inputs) - len(pending)} already processed, {len(pending)} to go.")
+
+    totals = {"files": 0, "failed": 0, "messages": 0, "bytes": 0}
+    tasks = [(path, os.path.join(output_dir, output_name(path)), use_cache) for path in pending]
+    start = time.perf_counter()
+    # Worker processes are replaced every few inputs, so memory fragmented by huge
+    # documents is handed back to the OS.
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(quiet,),
+                                maxtasksperchild=max_tasks_per_child)
+    try:
+        for record in pool.imap_unordered(_parse_one, tasks):
+            manifest.record(record)
+            totals["files"] += 1
+            totals["bytes"] += record["size"]
+            if record["status"] == 'done':
+                totals["messages"] += record["messages"]
+                print(f"[{totals['files']}/{len(tasks)}] {record['input']}: "
+                      f"{record['messages']:,} messages in {record['seconds']:.2f}s")
+            else:
+                totals["failed"] += 1
+                print(f"[{totals['files']}/{len(tasks)}] {record['input']}: FAILED: {record['error']}")
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        manifest.close()
+
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+def _print_totals(totals: dict):
+    seconds = totals["seconds"] or float('inf')
+    print(f"\nProcessed {totals['files']:,} input(s) ({totals['failed']:,} failed), "
+          f"{totals['messages']:,} messages, {totals['bytes'] / 1e6:,.1f} MB in {totals['seconds']:.1f}s")
+    print(f"Throughput: {totals['files'] / seconds:,.2f} files/s, {totals['messages'] / seconds:,.0f} messages/s, "
+          f"{totals['bytes'] / 1e6 / seconds:,.2f} MB/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse many chat exports into one NDJSON file each.")
+    parser.add_argument('inputs', nargs='+', help="export files, directories (searched recursively) or globs")
+    parser.add_argument('--output-dir', required=True, help="where the NDJSON files and the manifest go")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--manifest', help="checkpoint manifest (default: OUTPUT_DIR/manifest.jsonl)")
+    parser.add_argument('--retry-failed', action='store_true', help="parse inputs that failed in earlier runs again")
+    parser.add_argument('--cache', action='store_true', help="use the result cache (off: backfills rarely repeat)")
+    parser.add_argument('--verbose', action='store_true', help="show the parser's per-file log")
+    args = parser.parse_args(argv)
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        print("No input files found.", file=sys.stderr)
+        return 2
+    try:
+        totals = run(inputs, args.output_dir, args.workers, args.manifest, use_cache=args.cache,
+                     quiet=not args.verbose, retry_failed=args.retry_failed)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        return 130
+    _print_totals(totals)
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
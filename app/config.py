@@ -1,6 +1,7 @@
 # app/config.py
 
 import os
+import tempfile
 
 class Settings:
     # We hardcode the list here because free accounts don't have environment variables
@@ -10,4 +11,63 @@ class Settings:
         "https://spnnnnn.pythonanywhere.com"  # Your PythonAnywhere domain
     ]
 
+    # Size of the process pool that parses ZIP members in parallel; 1 keeps the serial path.
+    PARSE_WORKERS: int = int(os.environ.get("PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+
+    # Background parse jobs (/api/parse?mode=async): concurrent jobs, and how long a
+    # finished job's result is kept before it is evicted.
+    JOB_WORKERS: int = int(os.environ.get("JOB_WORKERS", 2))
+    JOB_RESULT_TTL_SECONDS: int = int(os.environ.get("JOB_RESULT_TTL_SECONDS", 3600))
+    # Where jobs are kept, so any worker process can answer for them.
+    JOB_STORE_PATH: str = os.environ.get("JOB_STORE_PATH",
+                                         os.path.join(tempfile.gettempdir(), "parser-results", "jobs.sqlite3"))
+
+    # Messages serialized per chunk when streaming NDJSON responses.
+    NDJSON_CHUNK_SIZE: int = int(os.environ.get("NDJSON_CHUNK_SIZE", 1000))
+    # Compression levels of responses to clients that accept gzip or zstd.
+    GZIP_LEVEL: int = int(os.environ.get("GZIP_LEVEL", 6))
+    ZSTD_LEVEL: int = int(os.environ.get("ZSTD_LEVEL", 3))
+
+    # Where request bodies are spooled while they are uploaded and parsed.
+    UPLOAD_DIR: str = os.environ.get("UPLOAD_DIR", tempfile.gettempdir())
+
+    # Content-addressed cache of extracted messages, per upload and per ZIP member.
+    CACHE_ENABLED: bool = os.environ.get("CACHE_ENABLED", "1") == "1"
+    # Entries are unpickled, so the default is the user's own cache directory rather
+    # than the shared temp directory (see ResultCache for the checks it must pass).
+    CACHE_DIR: str = os.environ.get("CACHE_DIR", os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "parser"))
+    CACHE_MAX_BYTES: int = int(os.environ.get("CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+    # Stored parse results (/api/parse?store=1), paged through /api/results/<id>/messages.
+    RESULT_STORE_PATH: str = os.environ.get("RESULT_STORE_PATH",
+                                            os.path.join(tempfile.gettempdir(), "parser-results", "results.sqlite3"))
+    RESULT_TTL_SECONDS: int = int(os.environ.get("RESULT_TTL_SECONDS", 24 * 3600))
+    RESULT_PAGE_SIZE: int = int(os.environ.get("RESULT_PAGE_SIZE", 1000))
+    RESULT_MAX_PAGE_SIZE: int = int(os.environ.get("RESULT_MAX_PAGE_SIZE", 10000))
+
+    # Append sessions (/api/sessions): what each session has taken in so far, kept
+    # until SESSION_TTL_SECONDS after its last upload.
+    SESSION_STORE_PATH: str = os.environ.get("SESSION_STORE_PATH",
+                                             os.path.join(tempfile.gettempdir(), "parser-results", "sessions.sqlite3"))
+    SESSION_TTL_SECONDS: int = int(os.environ.get("SESSION_TTL_SECONDS", 30 * 24 * 3600))
+
+    # Admission control of parse requests, shared by all preloaded worker processes:
+    # each parse is charged ADMISSION_BYTES_FACTOR x its upload size against
+    # ADMISSION_MEMORY_BYTES, at most ADMISSION_MAX_PARSES run at once, and up to
+    # ADMISSION_QUEUE_SIZE more wait ADMISSION_QUEUE_TIMEOUT seconds for room.
+    ADMISSION_ENABLED: bool = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+    ADMISSION_MEMORY_BYTES: int = int(os.environ.get("ADMISSION_MEMORY_BYTES", 2 * 1024 ** 3))
+    ADMISSION_MAX_PARSES: int = int(os.environ.get("ADMISSION_MAX_PARSES", 4))
+    ADMISSION_BYTES_FACTOR: float = float(os.environ.get("ADMISSION_BYTES_FACTOR", 8))
+    ADMISSION_QUEUE_SIZE: int = int(os.environ.get("ADMISSION_QUEUE_SIZE", 16))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 30))
+    ADMISSION_RETRY_AFTER: int = int(os.environ.get("ADMISSION_RETRY_AFTER", 10))
+
+    # Per-request profiling: a parse sent with an X-Profile-Token header matching this
+    # token runs under cProfile. Empty disables it. The newest PROFILE_KEEP are kept.
+    PROFILE_TOKEN: str = os.environ.get("PROFILE_TOKEN", "")
+    PROFILE_DIR: str = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "parser-profiles"))
+    PROFILE_KEEP: int = int(os.environ.get("PROFILE_KEEP", 100))
+
 settings = Settings()
\ No newline at end of file
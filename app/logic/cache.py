@@ -0,0 +1,163 @@
+# Disk-backed, content-addressed cache of extracted messages, so re-uploads of the
+# same export (or of an export with a few new conversations) skip unchanged work.
+
+import os
+import stat
+import pickle
+import hashlib
+import tempfile
+import threading
+
+from ..config import settings
+
+# Bump whenever extraction output changes, so stale entries are never served.
+CACHE_VERSION = 2
+# Messages per pickle in an entry; see ResultCache.put().
+_SLICE_SIZE = 10000
+
+
+def _kind(filename: str) -> str:
+    # JSON and HTML files go through different parsers, so the kind is part of every key.
+    return 'json' if filename.lower().endswith('.json') else 'html'
+
+
+def file_upload_key(path: str, filename: str) -> str:
+    """Key for a whole upload on disk: the hash of its bytes, read a block at a time."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return f'upload-{_kind(filename)}-' + digest.hexdigest()
+
+
+def member_key(info) -> str:
+    """
+    Key for one ZIP member, from the CRC and size recorded in the archive, so an
+    unchanged member is recognised without decompressing it.
+    """
+    return f'member-{_kind(info.filename)}-{info.CRC:08x}-{info.file_size}'
+
+
+class ResultCache:
+    """
+    Pickled message lists under `directory`, evicted least-recently-used beyond `max_bytes`.
+    Entries are unpickled, so the cache is only used if the directory is private to
+    this user: created with mode 0700, and refused (with a warning) if it is a
+    symlink, is owned by another user, or can be written by anyone else.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self._usable = None  # checked on first use
+
+    def _check_directory(self) -> bool:
+        if self._usable is None:
+            self._usable = self._private_directory()
+        return self._usable
+
+    def _private_directory(self) -> bool:
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            info = os.lstat(self.directory)
+        except OSError as e:
+            print(f"Warning: Result cache disabled, cannot create {self.directory}: {e}")
+            return False
+        if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+                or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+            print(f"Warning: Result cache disabled, {self.directory} is not a directory "
+                  f"owned by and only writable by this user")
+            return False
+        return True
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'v{CACHE_VERSION}-{key}.pkl')
+
+    def get(self, key: str):
+        if not self._check_directory():
+            return None
+        path = self._path(key)
+        try:
+            value = []
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        value.extend(pickle.load(f))
+                    except EOFError:
+                        break
+            os.utime(path)  # mtime doubles as the LRU clock
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Dropping unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def put(self, key: str, value: list):
+        if not self._check_directory():
+            return
+        # Pickled straight to the file, so the entry never exists as one bytes object in
+        # memory, and a slice at a time: a pickler remembers every object it has written.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for start in range(0, len(value), _SLICE_SIZE):
+                    pickle.dump(value[start:start + _SLICE_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            if size > self.max_bytes:
+                self._remove(tmp_path)
+                return
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+        path = self._path(key)
+        with self._lock:
+            # An entry written again replaces the old one, whose size no longer counts.
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            try:
+                os.replace(tmp_path, path)
+            except BaseException:
+                self._remove(tmp_path)
+                raise
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += size - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            return [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                    for entry in it if entry.name.endswith('.pkl')]
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Deletes the least recently used entries until the cache is back under 90% of max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            self._remove(path)
+            total -= size
+        self._size = total
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+result_cache = ResultCache(settings.CACHE_DIR, settings.CACHE_MAX_BYTES) if settings.CACHE_ENABLED else None
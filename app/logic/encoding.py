@@ -0,0 +1,139 @@
+# Response encodings that are produced chunk by chunk instead of as one big string.
+
+import json
+import zlib
+
+from ..parsers.date_parser import parse_epoch
+
+# Optional: without them, zstd compression and MessagePack are simply not offered.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+COLUMNAR_MIMETYPE = 'application/vnd.parser.columnar+x-ndjson'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+MSGPACK_AVAILABLE = msgpack is not None
+# What iter_compressed() can produce, preferred first.
+CONTENT_ENCODINGS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def iter_ndjson(messages: list, statistics: dict, chunk_size: int = 1000, release: bool = False):
+    """
+    Yields the sorted messages (Message records) as newline-delimited JSON, `chunk_size` records per
+    chunk, followed by a single {"statistics": {...}} trailer record.
+    With release=True each message is dropped from the list once it has been
+    serialized, so memory shrinks as the response goes out.
+    """
+    for start in range(0, len(messages), chunk_size):
+        end = min(start + chunk_size, len(messages))
+        lines = [json.dumps(messages[i].to_dict(), ensure_ascii=False, separators=(',', ':'))
+                 for i in range(start, end)]
+        if release:
+            messages[start:end] = [None] * (end - start)
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
+    yield (json.dumps({"statistics": statistics}, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def iter_json(result: dict, chunk_size: int = 1000, release: bool = False):
+    """
+    Yields {"messages": [...], "statistics": {...}} as one JSON document, a chunk of
+    messages at a time, byte for byte what Flask's jsonify() makes of the same
+    result with the messages as dicts (sorted keys, ASCII escapes, compact, trailing
+    newline) without ever holding the whole document. `release` as in iter_ndjson().
+    """
+    messages = result["messages"]
+    encode = json.JSONEncoder(ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode
+    rest = {key: value for key, value in result.items() if key != "messages"}
+    yield b'{"messages":['
+    for start in range(0, len(messages), chunk_size):
+        end = min(start + chunk_size, len(messages))
+        chunk = ','.join(encode(messages[i].to_dict()) for i in range(start, end))
+        if release:
+            messages[start:end] = [None] * (end - start)
+        yield (',' + chunk if start else chunk).encode('utf-8')
+    tail = encode(rest)[1:]
+    yield (']' + (',' + tail if tail != '}' else '}') + '\n').encode('utf-8')
+
+
+def iter_columns(messages: list, chunk_size: int = 1000, release: bool = False):
+    """
+    Yields the sorted messages as column blocks of up to `chunk_size` messages:
+
+        {"sources": [...], "senders": [...],
+         "source": [...], "sender": [...], "timestamp": [...], "message": [...]}
+
+    Sources and senders are dictionary-coded: "source" and "sender" hold indexes
+    into the list of every source (sender) seen so far, and "sources" ("senders")
+    only the ones this block adds to it. "timestamp" holds epoch seconds, each as
+    the difference from the previous message's (the first from 0), so a client
+    recovers them with a running sum. `release` as in iter_ndjson().
+    """
+    source_codes, sender_codes = {}, {}
+    previous = 0
+    for start in range(0, len(messages), chunk_size):
+        end = min(start + chunk_size, len(messages))
+        new_sources, new_senders = [], []
+        sources, senders, timestamps, texts = [], [], [], []
+        for i in range(start, end):
+            msg = messages[i]
+            code = source_codes.get(msg.source)
+            if code is None:
+                code = source_codes[msg.source] = len(source_codes)
+                new_sources.append(msg.source)
+            sources.append(code)
+            code = sender_codes.get(msg.sender)
+            if code is None:
+                code = sender_codes[msg.sender] = len(sender_codes)
+                new_senders.append(msg.sender)
+            senders.append(code)
+            epoch = msg.timestamp
+            if type(epoch) is not int:
+                epoch = parse_epoch(epoch)
+            timestamps.append(epoch - previous)
+            previous = epoch
+            texts.append(msg.message)
+        if release:
+            messages[start:end] = [None] * (end - start)
+        yield {"sources": new_sources, "senders": new_senders,
+               "source": sources, "sender": senders, "timestamp": timestamps, "message": texts}
+
+
+def iter_columnar(messages: list, statistics: dict, chunk_size: int = 1000, release: bool = False):
+    """iter_columns() blocks as NDJSON, one per line, followed by the {"statistics": {...}} trailer."""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for block in iter_columns(messages, chunk_size, release):
+        yield (encode(block) + '\n').encode('utf-8')
+    yield (encode({"statistics": statistics}) + '\n').encode('utf-8')
+
+
+def iter_msgpack(messages: list, statistics: dict, chunk_size: int = 1000, release: bool = False):
+    """The iter_columnar() stream as a sequence of MessagePack maps instead of JSON lines."""
+    # With unicode_errors set, strings are encoded through a temporary copy; otherwise
+    # CPython keeps a UTF-8 copy of every non-ASCII message on the string itself.
+    pack = msgpack.Packer(unicode_errors='strict').pack
+    for block in iter_columns(messages, chunk_size, release):
+        yield pack(block)
+    yield pack({"statistics": statistics})
+
+
+def iter_compressed(chunks, encoding: str, level: int):
+    """
+    Compresses a chunk stream as it goes, as `encoding` ('gzip', or 'zstd' when
+    zstandard is installed), yielding whatever the compressor has ready.
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,245 @@
+# Background parse jobs: /api/parse?mode=async hands the upload to a small
+# thread pool and the client polls for progress and the result.
+#
+# The parse runs in the worker process that took the upload, but its status and
+# result are kept where every worker can read them: the job in a SQLite table,
+# a result with messages in the result store (store.py), and the statistics of a
+# stats-only result in the job's row. A poll may land on any gunicorn worker.
+
+import os
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .tasks import parse_upload
+from .store import SQLiteStore, result_store, encode_json
+from ..config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    members_done INTEGER NOT NULL,
+    members_total INTEGER NOT NULL,
+    messages_extracted INTEGER NOT NULL,
+    store INTEGER NOT NULL,
+    result_id TEXT,
+    statistics TEXT,
+    error TEXT,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+
+_COLUMNS = ('id', 'filename', 'status', 'members_done', 'members_total', 'messages_extracted', 'store',
+            'result_id', 'statistics', 'error', 'pid', 'created_at', 'finished_at')
+
+# Progress is written at most this often (seconds); status changes always are.
+_PROGRESS_INTERVAL = 0.5
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Job:
+    def __init__(self, filename: str, store: bool = False):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.members_done = 0
+        self.members_total = 0
+        self.messages_extracted = 0
+        self.store = store  # the client asked for the result in the result store, under result_id
+        self.result_id = None  # where a result with messages was saved
+        self.statistics = None  # the result of a stats-only parse
+        self.error = None
+        self.pid = os.getpid()  # of the worker process running the parse
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_row(cls, row) -> 'Job':
+        job = cls.__new__(cls)
+        for name, value in zip(_COLUMNS, row):
+            setattr(job, name, value)
+        job.store = bool(job.store)
+        job.statistics = json.loads(job.statistics) if job.statistics is not None else None
+        return job
+
+    def to_row(self) -> tuple:
+        return tuple(encode_json(self.statistics) if name == 'statistics' and self.statistics is not None
+                     else getattr(self, name) for name in _COLUMNS)
+
+    def to_status(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "file_processed": self.filename,
+            "progress": {
+                "members_done": self.members_done,
+                "members_total": self.members_total,
+                "messages_extracted": self.messages_extracted,
+            },
+            "result_id": self.result_id if self.store else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobStore(SQLiteStore):
+    """Jobs in the SQLite database at `path`, deleted `ttl` seconds after they finished."""
+
+    schema = _SCHEMA
+
+    def save(self, job: Job):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f'INSERT OR REPLACE INTO jobs ({", ".join(_COLUMNS)}) '
+                             f'VALUES ({", ".join("?" * len(_COLUMNS))})', job.to_row())
+        finally:
+            conn.close()
+
+    def save_progress(self, job: Job):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('UPDATE jobs SET members_done = ?, members_total = ?, messages_extracted = ? '
+                             'WHERE id = ?', (job.members_done, job.members_total, job.messages_extracted, job.id))
+        finally:
+            conn.close()
+
+    def get(self, job_id: str):
+        conn = self._connect()
+        try:
+            row = conn.execute(f'SELECT {", ".join(_COLUMNS)} FROM jobs WHERE id = ? '
+                               f'AND (finished_at IS NULL OR finished_at > ?)',
+                               (job_id, time.time() - self.ttl)).fetchone()
+        finally:
+            conn.close()
+        return Job.from_row(row) if row else None
+
+    def delete_expired(self) -> list:
+        """Deletes the jobs that finished more than `ttl` seconds ago; returns their (result_id, store)."""
+        conn = self._connect()
+        try:
+            with conn:
+                cutoff = time.time() - self.ttl
+                expired = conn.execute('SELECT result_id, store FROM jobs WHERE finished_at <= ?',
+                                       (cutoff,)).fetchall()
+                conn.execute('DELETE FROM jobs WHERE finished_at <= ?', (cutoff,))
+        finally:
+            conn.close()
+        return expired
+
+
+class JobManager:
+    """Runs parses on a background executor and keeps finished jobs in `store` for its ttl."""
+
+    def __init__(self, workers: int, store: JobStore):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parse-job')
+        self._store = store
+
+    def submit(self, path: str, filename: str, filters=None, store: bool = False, stats_only: bool = False,
+               on_done=None, near_duplicates=None) -> Job:
+        """
+        Queues a parse of the upload at `path`; the job deletes the file when it is done
+        with it. With store=True the result is kept in the result store under its own id.
+        `on_done()` is called once the job has finished, whatever the outcome.
+        """
+        self._evict_expired()
+        job = Job(filename, store)
+        self._store.save(job)
+        self._executor.submit(self._run, job, path, filters, stats_only, on_done, near_duplicates)
+        return job
+
+    def get(self, job_id: str):
+        job = self._store.get(job_id)
+        if job and job.finished_at is None and not _process_alive(job.pid):
+            # The worker process running it exited (recycled, killed) before it finished.
+            job.status = 'failed'
+            job.error = "The worker running the parse job exited"
+            job.finished_at = time.time()
+            self._store.save(job)
+        return job
+
+    def result(self, job: Job):
+        """The result of a finished job, in the same shape as /parse, or None if it has expired."""
+        if job.statistics is not None:
+            return {"statistics": job.statistics}
+        summary = result_store.summary(job.result_id)
+        messages = result_store.messages(job.result_id)
+        if summary is None or messages is None:
+            return None
+        return {"messages": messages, "statistics": summary["statistics"]}
+
+    def _run(self, job: Job, path: str, filters=None, stats_only: bool = False, on_done=None,
+             near_duplicates=None):
+        job.status = 'running'
+        last_saved = 0.0
+
+        def update_progress(members_done: int, members_total: int, messages_extracted: int):
+            nonlocal last_saved
+            job.members_done = members_done
+            job.members_total = members_total
+            job.messages_extracted = messages_extracted
+            now = time.monotonic()
+            if now - last_saved >= _PROGRESS_INTERVAL:
+                last_saved = now
+                self._store.save_progress(job)
+
+        try:
+            self._store.save(job)
+            try:
+                result = parse_upload(path, job.filename, progress=update_progress, filters=filters,
+                                      stats_only=stats_only, near_duplicates=near_duplicates)
+            finally:
+                os.remove(path)
+            if "error" in result:
+                job.error = result["error"]
+                job.status = 'failed'
+            elif "messages" not in result:
+                job.statistics = result["statistics"]
+                job.status = 'done'
+            else:
+                try:
+                    job.result_id = result_store.save(result)
+                    job.status = 'done'
+                except Exception as e:
+                    job.error = f"Could not store the result: {e}"
+                    job.status = 'failed'
+        except Exception as e:
+            print(f"Error: Parse job {job.id} failed: {e}")
+            job.error = f"The parse job failed: {e}"
+            job.status = 'failed'
+        finally:
+            # Whatever went wrong, the job ends, so pollers stop waiting and it expires.
+            if job.status not in ('done', 'failed'):
+                job.status = 'failed'
+                job.error = job.error or "The parse job was interrupted"
+            job.finished_at = time.time()
+            try:
+                self._store.save(job)
+            finally:
+                if on_done:
+                    on_done()
+
+    def _evict_expired(self):
+        for result_id, store in self._store.delete_expired():
+            # Results saved only to be handed over between workers go with their job.
+            if result_id and not store:
+                result_store.delete(result_id)
+
+
+job_manager = JobManager(settings.JOB_WORKERS, JobStore(settings.JOB_STORE_PATH, settings.JOB_RESULT_TTL_SECONDS))
@@ -0,0 +1,138 @@
+# Opt-in cProfile capture of single parse requests. Each profile is stored under
+# its request id as a .pstats file, next to a JSON summary that attributes the
+# wall time to the parser modules.
+
+import os
+import re
+import json
+import time
+import uuid
+import pstats
+import cProfile
+
+from ..config import settings
+
+_PROFILE_ID_RE = re.compile(r'[0-9a-f]{32}')
+_PARSERS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'parsers')
+_APP_DIR = os.path.dirname(_PARSERS_DIR)
+
+
+def _module_of(filename: str):
+    """
+    Short name of the app module a function lives in ('date_parser', 'detector',
+    'extractors.telegram', 'logic.tasks', ...), or None for library and builtin code.
+    """
+    path = os.path.abspath(filename)
+    if not path.startswith(_APP_DIR + os.sep):
+        return None
+    module = os.path.splitext(os.path.relpath(path, _PARSERS_DIR if path.startswith(_PARSERS_DIR) else _APP_DIR))[0]
+    return module.replace(os.sep, '.')
+
+
+def _owners(func, stats: dict, memo: dict, visiting: set) -> dict:
+    """
+    Fractions of `func`'s self time owed to each app module. Library and builtin
+    functions (re, strptime, selectolax's C methods) are charged to the app
+    modules that called them, split by how much time each caller spent in them.
+    """
+    module = _module_of(func[0])
+    if module:
+        return {module: 1.0}
+    if func in memo:
+        return memo[func]
+    callers = stats[func][4]
+    if not callers or func in visiting:
+        return {'other': 1.0}
+
+    visiting.add(func)
+    weights = {caller: timing[2] or timing[0] for caller, timing in callers.items()}
+    total = sum(weights.values()) or 1
+    shares = {}
+    for caller, weight in weights.items():
+        for owner, fraction in _owners(caller, stats, memo, visiting).items():
+            shares[owner] = shares.get(owner, 0.0) + fraction * weight / total
+    visiting.discard(func)
+    memo[func] = shares
+    return shares
+
+
+def attribute_modules(stats: pstats.Stats) -> dict:
+    """Seconds of self time per app module, library time charged to its callers."""
+    memo = {}
+    seconds = {}
+    for func, (_, _, self_time, _, _) in stats.stats.items():
+        for owner, fraction in _owners(func, stats.stats, memo, set()).items():
+            seconds[owner] = seconds.get(owner, 0.0) + self_time * fraction
+    return {module: round(value, 4) for module, value in sorted(seconds.items(), key=lambda item: -item[1])}
+
+
+def _top_functions(stats: pstats.Stats, limit: int = 30) -> list:
+    rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:limit]
+    return [{
+        "function": f"{os.path.basename(filename)}:{line}({name})",
+        "calls": calls,
+        "self_seconds": round(self_time, 4),
+        "cumulative_seconds": round(cumulative, 4),
+    } for (filename, line, name), (_, calls, self_time, cumulative, _) in rows]
+
+
+def profile_path(profile_id: str, extension: str):
+    """Path of a stored profile artifact, or None if the id is malformed."""
+    if not _PROFILE_ID_RE.fullmatch(profile_id or ''):
+        return None
+    return os.path.join(settings.PROFILE_DIR, f'{profile_id}.{extension}')
+
+
+def _prune():
+    """Deletes the oldest profiles beyond settings.PROFILE_KEEP."""
+    with os.scandir(settings.PROFILE_DIR) as it:
+        summaries = sorted((entry for entry in it if entry.name.endswith('.json')),
+                           key=lambda entry: entry.stat().st_mtime)
+    for entry in summaries[:max(0, len(summaries) - settings.PROFILE_KEEP)]:
+        profile_id = entry.name[:-len('.json')]
+        for extension in ('json', 'pstats'):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, f'{profile_id}.{extension}'))
+            except FileNotFoundError:
+                pass
+
+
+def profile_call(label: str, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) under cProfile and stores the profile.
+    Returns (func's return value, profile id).
+    """
+    profile_id = uuid.uuid4().hex
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        wall_seconds = time.perf_counter() - start
+
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(profile_path(profile_id, 'pstats'))
+        stats = pstats.Stats(profiler)
+        summary = {
+            "profile_id": profile_id,
+            "label": label,
+            "created_at": time.time(),
+            "wall_seconds": round(wall_seconds, 4),
+            "modules": attribute_modules(stats),
+            "top_functions": _top_functions(stats),
+        }
+        with open(profile_path(profile_id, 'json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Stored profile {profile_id} for {label}: {wall_seconds:.2f}s, {summary['modules']}")
+        _prune()
+    return result, profile_id
+
+
+def load_summary(profile_id: str):
+    path = profile_path(profile_id, 'json')
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
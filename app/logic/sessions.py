@@ -0,0 +1,209 @@
+# Append sessions, for clients that upload a fresh export of the same chats again
+# and again (mostly the previous export plus a few days). A session remembers what
+# it has already taken in, so each upload costs what changed rather than the history:
+#
+# - per source file, its fingerprint, so a file that hasn't changed is skipped
+#   without even being decompressed;
+# - per source file, its high-water mark (the newest timestamp taken from it), so
+#   its older messages are dropped as soon as their timestamps are read;
+# - the digest of every message taken in, to tell new messages at or past the
+#   high-water mark from ones already there;
+# - the merged timeline, keyed by (timestamp, seq): new messages are slotted into
+#   place by the index, and the history is never read back or re-sorted.
+
+import time
+import uuid
+
+from ..config import settings
+from ..parsers.date_parser import format_epoch
+from .store import SQLiteStore, encode_json
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    next_seq INTEGER NOT NULL,
+    uploads INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_files (
+    session_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    high_water INTEGER,
+    PRIMARY KEY (session_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS session_digests (
+    session_id TEXT NOT NULL,
+    digest INTEGER NOT NULL,
+    PRIMARY KEY (session_id, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, timestamp, seq)
+) WITHOUT ROWID;
+"""
+
+# Digests are unsigned 64-bit; SQLite integers are signed.
+_DIGEST_OFFSET = 1 << 63
+# Digests looked up per query (SQLite allows 999 parameters in older builds).
+_LOOKUP_BATCH = 500
+_CACHE_KIB = 64 * 1024
+
+
+def parse_cursor(cursor: str):
+    """'<timestamp>:<seq>' -> (timestamp, seq). Raises ValueError."""
+    timestamp, seq = cursor.split(':')
+    return int(timestamp), int(seq)
+
+
+class SessionStore(SQLiteStore):
+    """Sessions in the SQLite database at `path`, deleted `ttl` seconds after their last upload."""
+
+    schema = _SCHEMA
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                self._delete_expired(conn)
+                conn.execute('INSERT INTO sessions (id, total, next_seq, uploads, created_at, updated_at) '
+                             'VALUES (?, 0, 0, 0, ?, ?)', (session_id, now, now))
+        finally:
+            conn.close()
+        return session_id
+
+    def summary(self, session_id: str):
+        """Message count, upload count and time span of a session, or None if it is unknown or expired."""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT total, uploads, created_at, updated_at FROM sessions '
+                               'WHERE id = ? AND updated_at > ?', (session_id, time.time() - self.ttl)).fetchone()
+            if row is None:
+                return None
+            first, last = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM session_messages '
+                                       'WHERE session_id = ?', (session_id,)).fetchone()
+        finally:
+            conn.close()
+        total, uploads, created_at, updated_at = row
+        return {"session_id": session_id, "total_messages": total, "uploads": uploads,
+                "first_timestamp": format_epoch(first) if first is not None else None,
+                "last_timestamp": format_epoch(last) if last is not None else None,
+                "created_at": created_at, "updated_at": updated_at, "expires_at": updated_at + self.ttl}
+
+    def files(self, session_id: str):
+        """name -> (fingerprint, high-water mark) of every file seen, or None if the session is unknown or expired."""
+        conn = self._connect()
+        try:
+            if conn.execute('SELECT 1 FROM sessions WHERE id = ? AND updated_at > ?',
+                            (session_id, time.time() - self.ttl)).fetchone() is None:
+                return None
+            return {name: (fingerprint, high_water) for name, fingerprint, high_water in
+                    conn.execute('SELECT name, fingerprint, high_water FROM session_files WHERE session_id = ?',
+                                 (session_id,))}
+        finally:
+            conn.close()
+
+    def append(self, session_id: str, messages: list, digests: list, files: dict):
+        """
+        Merges epoch-stamped, sorted `messages` (with their `digests`) into the
+        session's timeline, leaving out any the session already holds, and records
+        `files` (name -> (fingerprint, high-water mark)). Runs as one write
+        transaction, so concurrent uploads to a session never both add a message.
+        Returns (the messages added, in order and with their timestamps formatted,
+        session total), or None if the session is unknown or expired.
+        """
+        conn = self._connect(isolation_level=None)
+        try:
+            # Later uploads insert digests all over the index; more cache keeps its pages at hand.
+            conn.execute(f'PRAGMA cache_size = -{_CACHE_KIB}')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT total, next_seq FROM sessions WHERE id = ? AND updated_at > ?',
+                                   (session_id, time.time() - self.ttl)).fetchone()
+                if row is None:
+                    conn.execute('ROLLBACK')
+                    return None
+                total, next_seq = row
+
+                keys = [digest - _DIGEST_OFFSET for digest in digests]
+                known = set()
+                # An empty session (a first upload) has nothing to look up.
+                for start in range(0, len(keys) if total else 0, _LOOKUP_BATCH):
+                    batch = keys[start:start + _LOOKUP_BATCH]
+                    known.update(key for key, in conn.execute(
+                        f'SELECT digest FROM session_digests WHERE session_id = ? AND digest IN '
+                        f'({",".join("?" * len(batch))})', [session_id, *batch]))
+                added = [(msg, key) for msg, key in zip(messages, keys) if key not in known]
+
+                # In key order, so the index is appended to rather than split at random pages.
+                conn.executemany('INSERT INTO session_digests (session_id, digest) VALUES (?, ?)',
+                                 ((session_id, key) for key in sorted(key for _, key in added)))
+                conn.executemany('INSERT INTO session_messages (session_id, timestamp, seq, data) VALUES (?, ?, ?, ?)',
+                                 (self._message_row(session_id, next_seq + i, msg) for i, (msg, _) in enumerate(added)))
+                conn.executemany('INSERT OR REPLACE INTO session_files (session_id, name, fingerprint, high_water) '
+                                 'VALUES (?, ?, ?, ?)',
+                                 ((session_id, name, fingerprint, high_water)
+                                  for name, (fingerprint, high_water) in files.items()))
+                total += len(added)
+                conn.execute('UPDATE sessions SET total = ?, next_seq = ?, uploads = uploads + 1, updated_at = ? '
+                             'WHERE id = ?', (total, next_seq + len(added), time.time(), session_id))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+        return [msg for msg, _ in added], total
+
+    @staticmethod
+    def _message_row(session_id: str, seq: int, msg) -> tuple:
+        epoch = msg.timestamp
+        msg.timestamp = format_epoch(epoch)
+        return session_id, epoch, seq, encode_json(msg.to_dict())
+
+    def page(self, session_id: str, cursor, limit: int, since: int = None, until: int = None):
+        """
+        Up to `limit` messages of the timeline after `cursor` ((timestamp, seq) of the
+        last message of the previous page, None to start), optionally between the
+        epochs `since` and `until`, as JSON strings, plus the next page's cursor
+        ('<timestamp>:<seq>', None after the last page). None if the session is unknown or expired.
+        """
+        conditions, params = ['session_id = ?'], [session_id]
+        if cursor is not None:
+            conditions.append('(timestamp, seq) > (?, ?)')
+            params.extend(cursor)
+        if since is not None:
+            conditions.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('timestamp <= ?')
+            params.append(until)
+        conn = self._connect()
+        try:
+            if conn.execute('SELECT 1 FROM sessions WHERE id = ? AND updated_at > ?',
+                            (session_id, time.time() - self.ttl)).fetchone() is None:
+                return None
+            rows = conn.execute(f'SELECT timestamp, seq, data FROM session_messages WHERE {" AND ".join(conditions)} '
+                                f'ORDER BY timestamp, seq LIMIT ?', [*params, limit + 1]).fetchall()
+        finally:
+            conn.close()
+        next_cursor = f'{rows[limit - 1][0]}:{rows[limit - 1][1]}' if len(rows) > limit else None
+        return [data for _, _, data in rows[:limit]], next_cursor
+
+    def _delete_expired(self, conn):
+        expired = [session_id for session_id, in conn.execute('SELECT id FROM sessions WHERE updated_at <= ?',
+                                                              (time.time() - self.ttl,))]
+        for session_id in expired:
+            for table in ('session_messages', 'session_digests', 'session_files'):
+                conn.execute(f'DELETE FROM {table} WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+
+session_store = SessionStore(settings.SESSION_STORE_PATH, settings.SESSION_TTL_SECONDS)
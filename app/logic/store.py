@@ -0,0 +1,160 @@
+# Parse results kept in a local SQLite database under a result id, so clients can
+# page through a large result by cursor instead of receiving it in one response,
+# and can come back to it without re-uploading.
+#
+# Each message is stored as its final JSON encoding, keyed by its position in the
+# sorted output; a page is one index range scan spliced into the response as is.
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from ..config import settings
+from ..parsers.records import Message
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    statistics TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    result_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (result_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_json(value) -> str:
+    return _ENCODER.encode(value)
+
+
+class SQLiteStore:
+    """A SQLite database at `path` whose `schema` is created on first use."""
+
+    schema = ''
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        # One short-lived connection per call: requests and jobs run on different threads.
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    conn = sqlite3.connect(self.path)
+                    try:
+                        conn.execute('PRAGMA journal_mode=WAL')
+                        conn.executescript(self.schema)
+                    finally:
+                        conn.close()
+                    self._ready = True
+        return sqlite3.connect(self.path, timeout=30, **kwargs)
+
+
+class ResultStore(SQLiteStore):
+    """Results in the SQLite database at `path`, deleted `ttl` seconds after they were saved."""
+
+    schema = _SCHEMA
+
+    def save(self, result: dict) -> str:
+        """Stores a parse result ({"messages": [Message, ...], "statistics": {...}}) and returns its id."""
+        result_id = uuid.uuid4().hex
+        statistics = result["statistics"]
+        conn = self._connect()
+        try:
+            with conn:
+                self._delete_expired(conn)
+                conn.executemany('INSERT INTO messages (result_id, seq, data) VALUES (?, ?, ?)',
+                                 ((result_id, seq, encode_json(msg.to_dict()))
+                                  for seq, msg in enumerate(result["messages"])))
+                conn.execute('INSERT INTO results (id, filename, statistics, total, created_at) VALUES (?, ?, ?, ?, ?)',
+                             (result_id, statistics.get("file_processed", ""), encode_json(statistics),
+                              len(result["messages"]), time.time()))
+        finally:
+            conn.close()
+        return result_id
+
+    def summary(self, result_id: str):
+        """The statistics and message count of a stored result, or None if it is unknown or expired."""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT statistics, total, created_at FROM results WHERE id = ? AND created_at > ?',
+                               (result_id, time.time() - self.ttl)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        statistics, total, created_at = row
+        return {"result_id": result_id, "statistics": json.loads(statistics), "total_messages": total,
+                "created_at": created_at, "expires_at": created_at + self.ttl}
+
+    def page(self, result_id: str, cursor: int, limit: int):
+        """
+        Up to `limit` messages from position `cursor` on, as a list of JSON strings,
+        plus the cursor of the next page (None after the last one).
+        Returns None if the result is unknown or expired.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT total FROM results WHERE id = ? AND created_at > ?',
+                               (result_id, time.time() - self.ttl)).fetchone()
+            if row is None:
+                return None
+            rows = conn.execute('SELECT data FROM messages WHERE result_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+                                (result_id, cursor, limit)).fetchall()
+        finally:
+            conn.close()
+        next_cursor = cursor + limit if cursor + limit < row[0] else None
+        return [data for data, in rows], next_cursor
+
+    def messages(self, result_id: str):
+        """All messages of a stored result as Message records, in order, or None if it is unknown or expired."""
+        conn = self._connect()
+        try:
+            if conn.execute('SELECT 1 FROM results WHERE id = ? AND created_at > ?',
+                            (result_id, time.time() - self.ttl)).fetchone() is None:
+                return None
+            messages = []
+            for data, in conn.execute('SELECT data FROM messages WHERE result_id = ? ORDER BY seq', (result_id,)):
+                msg = json.loads(data)
+                messages.append(Message(msg['source'], msg['timestamp'], msg['sender'], msg['message']))
+        finally:
+            conn.close()
+        return messages
+
+    def delete(self, result_id: str):
+        conn = self._connect()
+        try:
+            with conn:
+                self._delete(conn, result_id)
+        finally:
+            conn.close()
+
+    def _delete_expired(self, conn: sqlite3.Connection):
+        expired = [result_id for result_id, in conn.execute('SELECT id FROM results WHERE created_at <= ?',
+                                                            (time.time() - self.ttl,))]
+        for result_id in expired:
+            self._delete(conn, result_id)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, result_id: str):
+        conn.execute('DELETE FROM messages WHERE result_id = ?', (result_id,))
+        conn.execute('DELETE FROM results WHERE id = ?', (result_id,))
+
+
+result_store = ResultStore(settings.RESULT_STORE_PATH, settings.RESULT_TTL_SECONDS)
@@ -2,60 +2,296 @@
 
 import os
 import json
+import time
 import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from zipfile import ZipFile, is_zipfile
 
 # Import the actual parsing functions that do the real work.
-from ..parsers.main_parser import process_single_file, deduplicate_and_sort_messages
+from ..parsers.main_parser import (
+    process_single_file, extract_messages, keep_unseen_messages, deduplicate_and_sort_messages,
+    normalize_timestamps
+)
+from ..parsers.utils import DigestSet, generate_message_digests
+from ..config import settings
+from ..metrics import metrics
+from ..parsers.stats import MessageStats, StatsCollector
+from .cache import result_cache, file_upload_key, member_key
+from .sessions import session_store
 
-def parse_file_and_get_results(file_content: bytes, filename: str) -> dict:
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Returns the shared member-parsing pool, (re)creating it if the size changed."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # 'spawn' so forking from a threaded server process can't inherit held locks.
+            _executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = workers
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    """Drops a broken pool, so the next _get_executor() call builds a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _submit_members(archive_path: str, members: list, results: list, start: int, workers: int, filters=None):
+    """
+    Submits the members from `start` on that have no extracted list in `results`
+    yet, largest first, replacing their entries with futures. A pool found broken
+    (left so by an earlier parse) is replaced once. Returns the executor used.
+    """
+    pending = sorted((i for i in range(start, len(members)) if not isinstance(results[i], list)),
+                     key=lambda i: members[i].file_size, reverse=True)
+    for attempt in (1, 2):
+        executor = _get_executor(workers)
+        try:
+            for i in pending:
+                results[i] = executor.submit(_extract_member, archive_path, members[i].filename, filters)
+            return executor
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            if attempt == 2:
+                raise
+
+
+def _extract_member(archive_path: str, member_name: str, filters=None) -> tuple:
+    """
+    Pool task: extracts one ZIP member without deduplicating it. The worker's
+    metrics are returned alongside, since they would otherwise stay in its process.
+    """
+    with ZipFile(archive_path, 'r') as archive:
+        with archive.open(member_name) as file_obj:
+            file_obj.filename = member_name
+            file_obj.file_size = archive.getinfo(member_name).file_size
+            extracted = extract_messages(file_obj, filters)
+    return extracted, metrics.drain()
+
+
+def _cached_member(cache, info):
+    return cache.get(member_key(info)) if cache else None
+
+
+def _cache_member(cache, info, extracted: list):
+    if cache:
+        cache.put(member_key(info), extracted)
+
+
+def _storable(cache, filters):
+    # Members skipped by a platform filter come back empty, which must not be cached.
+    return None if filters is not None and filters.platforms is not None else cache
+
+
+def _extracted_members(archive_path: str, archive: ZipFile, members: list, workers: int, cache=None,
+                       filters=None):
+    """
+    Yields (info, extracted messages) for each member, in archive order. With
+    workers > 1 the members are extracted on the process pool, largest first;
+    members already in the result cache are not extracted at all.
+    """
+    if workers > 1 and len(members) > 1:
+        results = [_cached_member(cache, info) for info in members]
+        executor = _submit_members(archive_path, members, results, 0, workers, filters)
+        retried = False
+        for i, info in enumerate(members):
+            extracted = results[i]
+            if not isinstance(extracted, list):
+                try:
+                    extracted, snapshot = extracted.result()
+                except BrokenProcessPool:
+                    # A pool process died (an OOM kill, say), taking the pool with it: the
+                    # members not collected yet go to a new pool, once.
+                    _discard_executor(executor)
+                    if retried:
+                        raise
+                    retried = True
+                    print("Warning: A parse worker process died; retrying the remaining members on a new pool.")
+                    executor = _submit_members(archive_path, members, results, i, workers, filters)
+                    try:
+                        extracted, snapshot = results[i].result()
+                    except BrokenProcessPool:
+                        _discard_executor(executor)
+                        raise
+                metrics.merge(snapshot)
+                _cache_member(_storable(cache, filters), info, extracted)
+            yield info, extracted
+    else:
+        for info in members:
+            extracted = _cached_member(cache, info)
+            if extracted is None:
+                with archive.open(info) as file_obj:
+                    file_obj.filename = info.filename
+                    file_obj.file_size = info.file_size
+                    extracted = extract_messages(file_obj, filters)
+                _cache_member(_storable(cache, filters), info, extracted)
+            yield info, extracted
+
+
+def _process_archive_serial(archive: ZipFile, members: list, seen_hashes: DigestSet, progress=None,
+                            cache=None, filters=None, all_unique_messages=None) -> list:
+    """
+    Extracts and deduplicates the members one by one into `all_unique_messages`
+    (a new list, or anything with extend() and len() such as a StatsCollector).
+    """
+    all_unique_messages = [] if all_unique_messages is None else all_unique_messages
+    for done, (info, extracted) in enumerate(_extracted_members(None, archive, members, 1, cache, filters), 1):
+        all_unique_messages.extend(keep_unseen_messages(extracted, seen_hashes, filters))
+        if progress:
+            progress(done, len(members), len(all_unique_messages))
+    return all_unique_messages
+
+
+def _process_archive_parallel(archive_path: str, members: list, seen_hashes: DigestSet, workers: int,
+                              progress=None, cache=None, filters=None, all_unique_messages=None) -> list:
+    """
+    Extracts members on the process pool, largest first, then deduplicates the
+    results in archive order so the output matches the serial path exactly.
+    Members already in the result cache are not submitted at all.
+    """
+    all_unique_messages = [] if all_unique_messages is None else all_unique_messages
+    members_extracted = _extracted_members(archive_path, None, members, workers, cache, filters)
+    for done, (info, extracted) in enumerate(members_extracted, 1):
+        all_unique_messages.extend(keep_unseen_messages(extracted, seen_hashes, filters))
+        if progress:
+            progress(done, len(members), len(all_unique_messages))
+    return all_unique_messages
+
+
+def _build_result(final_messages: list, filename: str, near_duplicates=None) -> dict:
+    result = {
+        "messages": final_messages,
+        "statistics": {
+            "total_messages": len(final_messages),
+            "unique_senders": len(set(msg.sender for msg in final_messages)),
+            "file_processed": filename
+        }
+    }
+    if near_duplicates:
+        result["statistics"]["near_duplicates_folded"] = near_duplicates.folded
+    return result
+
+
+def parse_file_and_get_results(file_content: bytes, filename: str, workers: int = None, progress=None,
+                               use_cache: bool = True, filters=None, stats_only: bool = False,
+                               near_duplicates=None) -> dict:
     """
     This is the main function. It takes a file, processes it completely,
     and returns the final result as a dictionary. It is a single, blocking operation.
+    The bytes are written to a temporary file and handed to parse_upload().
     """
+    # Use a temporary file to handle both single files and zips uniformly
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(file_content)
+        temp_file_path = temp_file.name
+    try:
+        return parse_upload(temp_file_path, filename, workers, progress, use_cache, filters, stats_only,
+                            near_duplicates)
+    finally:
+        os.remove(temp_file_path)
+
+
+def parse_upload(path: str, filename: str, workers: int = None, progress=None, use_cache: bool = True,
+                 filters=None, stats_only: bool = False, near_duplicates=None) -> dict:
+    """
+    Parses an upload that is already on disk at `path` (left in place), so no
+    copy of it is ever held in memory: ZIPs are opened from the file and each
+    member is streamed out of it.
+    ZIP members are spread over `workers` processes (settings.PARSE_WORKERS by default).
+    If given, `progress(members_done, members_total, messages_extracted)` is called
+    after each file is processed. Uploads and ZIP members seen before are served
+    from the result cache unless use_cache is False.
+    `filters` (a MessageFilter) narrows the result; filtered parses still use cached
+    ZIP members but bypass the whole-upload cache.
+    With stats_only=True the result is just {"statistics": ...}, with per-sender,
+    platform, day and hour counts gathered as the messages stream past; the
+    message list is never built.
+    `near_duplicates` (a NearDuplicateFolder) folds near-duplicate messages as well;
+    such parses bypass the whole-upload cache too, and stats_only ones do collect
+    the messages, since folding needs them in time order.
+    """
+    cache = result_cache if use_cache else None
+    filters = filters or None
+    start = time.perf_counter()
     try:
         print(f"Stateless worker received file: {filename}")
 
-        # Use a temporary file to handle both single files and zips uniformly
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(file_content)
-            temp_file_path = temp_file.name
+        cache_key = file_upload_key(path, filename) if cache and not filters and not near_duplicates else None
+        if cache_key:
+            cached_messages = cache.get(cache_key)
+            if cached_messages is not None:
+                print("Upload found in result cache.")
+                if progress:
+                    progress(1, 1, len(cached_messages))
+                metrics.observe('total', time.perf_counter() - start, 'cached')
+                if stats_only:
+                    collector = StatsCollector()
+                    collector.extend(cached_messages)
+                    return {"statistics": collector.stats.to_dict(filename)}
+                return _build_result(cached_messages, filename)
 
-        all_unique_messages = []
-        seen_hashes = set()
+        all_unique_messages = StatsCollector(filters) if stats_only and not near_duplicates else []
+        seen_hashes = DigestSet()
 
-        if is_zipfile(temp_file_path):
+        if is_zipfile(path):
             print("Detected ZIP file. Extracting and processing...")
-            with ZipFile(temp_file_path, 'r') as archive:
-                for member_name in archive.namelist():
-                    if member_name.endswith('/'): continue # Skip directories
-                    with archive.open(member_name) as file_obj:
-                        file_obj.filename = member_name
-                        if file_obj.peek(1): # Check if file has content
-                            new_messages = process_single_file(file_obj, seen_hashes)
-                            all_unique_messages.extend(new_messages)
+            workers = workers or settings.PARSE_WORKERS
+            with ZipFile(path, 'r') as archive:
+                with metrics.timed('unzip'):
+                    # Skip directories and empty members
+                    members = [info for info in archive.infolist()
+                               if not info.filename.endswith('/') and info.file_size > 0]
+                if workers > 1 and len(members) > 1:
+                    print(f"Parsing {len(members)} members on {workers} worker processes...")
+                    _process_archive_parallel(path, members, seen_hashes, workers, progress, cache, filters,
+                                              all_unique_messages)
+                else:
+                    _process_archive_serial(archive, members, seen_hashes, progress, cache, filters,
+                                            all_unique_messages)
         else:
             print("Processing single file...")
-            with open(temp_file_path, 'rb') as f:
+            with open(path, 'rb') as f:
                 f.filename = filename
-                new_messages = process_single_file(f, seen_hashes)
+                new_messages = process_single_file(f, seen_hashes, filters)
                 all_unique_messages.extend(new_messages)
+            if progress:
+                progress(1, 1, len(all_unique_messages))
 
-        # Clean up the temporary file
-        os.remove(temp_file_path)
+        if stats_only:
+            if near_duplicates:
+                stats = MessageStats()
+                stats.add_all(deduplicate_and_sort_messages(all_unique_messages, filters=filters,
+                                                            near_duplicates=near_duplicates, format_output=False))
+                statistics = stats.to_dict(filename)
+                statistics["near_duplicates_folded"] = near_duplicates.folded
+            else:
+                statistics = all_unique_messages.stats.to_dict(filename)
+            metrics.observe('total', time.perf_counter() - start)
+            return {"statistics": statistics}
 
         print("Deduplicating and sorting final messages...")
-        final_messages = deduplicate_and_sort_messages(all_unique_messages)
+        final_messages = deduplicate_and_sort_messages(all_unique_messages, filters=filters,
+                                                       near_duplicates=near_duplicates)
+        if cache_key:
+            cache.put(cache_key, final_messages)
 
         # Build the final result object to be returned
-        result = {
-            "messages": final_messages,
-            "statistics": {
-                "total_messages": len(final_messages),
-                "unique_senders": len(set(msg.get('sender', 'Unknown') for msg in final_messages)),
-                "file_processed": filename
-            }
-        }
+        result = _build_result(final_messages, filename, near_duplicates)
+        metrics.observe('total', time.perf_counter() - start)
         print("Processing complete. Returning results.")
         return result
 
@@ -64,3 +300,102 @@ def parse_file_and_get_results(file_content: bytes, filename: str) -> dict:
         # Return an error object in the same format
         return {"error": str(e)}
 
+
+def _common_root(names: list) -> str:
+    """The top-level folder every name is under ('export-2021-03-08/'), or ''."""
+    roots = {name.split('/', 1)[0] + '/' for name in names}
+    if len(roots) != 1 or not all('/' in name for name in names):
+        return ''
+    return roots.pop()
+
+
+def parse_session_upload(path: str, filename: str, session_id: str, workers: int = None,
+                         use_cache: bool = True, sessions=None):
+    """
+    Appends an upload on disk at `path` to an append session (see sessions.py) and
+    returns just what it added: {"messages": [...], "statistics": {...}}, the new
+    messages in timestamp order. Returns None if the session is unknown or expired.
+    Files are told apart by their path in the archive, without the top-level
+    folder exports are often wrapped in; each is assumed to only grow at its
+    newest end, so only its messages from its high-water mark on are looked up.
+    """
+    sessions = sessions or session_store
+    cache = result_cache if use_cache else None
+    start = time.perf_counter()
+    try:
+        print(f"Session {session_id} received file: {filename}")
+        files = sessions.files(session_id)
+        if files is None:
+            return None
+
+        seen_hashes = DigestSet()
+        normalizers = {}
+        updates = {}
+        new_messages = []
+        new_digests = []
+        counts = {"files_unchanged": 0, "files_parsed": 0, "messages_below_high_water": 0}
+
+        def take(name: str, fingerprint: str, extracted: list):
+            high_water = files.get(name, (None, None))[1]
+            with metrics.timed('normalize'):
+                standardized = normalize_timestamps([msg for msg in extracted if msg.message], normalizers)
+            newest = max((msg.timestamp for msg in standardized), default=None)
+            if high_water is not None:
+                fresh = [msg for msg in standardized if msg.timestamp >= high_water]
+                counts["messages_below_high_water"] += len(standardized) - len(fresh)
+                standardized = fresh
+                newest = high_water if newest is None else max(newest, high_water)
+            digests = generate_message_digests(standardized)
+            for msg, digest, is_new in zip(standardized, digests, seen_hashes.add_new(digests)):
+                if is_new:
+                    new_messages.append(msg)
+                    new_digests.append(digest)
+            updates[name] = (fingerprint, newest)
+            counts["files_parsed"] += 1
+
+        if is_zipfile(path):
+            workers = workers or settings.PARSE_WORKERS
+            with ZipFile(path, 'r') as archive:
+                members = [info for info in archive.infolist()
+                           if not info.filename.endswith('/') and info.file_size > 0]
+                root = _common_root([info.filename for info in members])
+                names = {info.filename: info.filename[len(root):] for info in members}
+                changed = [info for info in members if files.get(names[info.filename], (None,))[0] != member_key(info)]
+                counts["files_unchanged"] = len(members) - len(changed)
+                print(f"{len(changed)} of {len(members)} files changed since the session's last upload.")
+                for info, extracted in _extracted_members(path, archive, changed, workers, cache):
+                    take(names[info.filename], member_key(info), extracted)
+        else:
+            fingerprint = file_upload_key(path, filename)
+            if files.get(filename, (None,))[0] == fingerprint:
+                counts["files_unchanged"] = 1
+            else:
+                with open(path, 'rb') as f:
+                    f.filename = filename
+                    take(filename, fingerprint, extract_messages(f))
+
+        with metrics.timed('sort'):
+            order = sorted(range(len(new_messages)), key=lambda i: new_messages[i].timestamp)
+        appended = sessions.append(session_id, [new_messages[i] for i in order], [new_digests[i] for i in order],
+                                   updates)
+        if appended is None:
+            return None
+        added, session_total = appended
+        metrics.inc('messages_deduplicated', len(new_messages) - len(added))
+        metrics.observe('total', time.perf_counter() - start, 'session')
+        print(f"Added {len(added)} new messages; the session now holds {session_total}.")
+        return {
+            "messages": added,
+            "statistics": dict(counts, **{
+                "total_messages": len(added),
+                "unique_senders": len(set(msg.sender for msg in added)),
+                "file_processed": filename,
+                "session_total_messages": session_total,
+                "first_timestamp": added[0].timestamp if added else None,
+                "last_timestamp": added[-1].timestamp if added else None,
+            }),
+        }
+
+    except Exception as e:
+        print(f"ERROR during session parsing: {e}")
+        return {"error": str(e)}
@@ -1,13 +1,17 @@
 # This is the correct version of app/main.py for your Flask application.
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 # This import is correct because endpoints.py is in the 'api' subdirectory.
 from .api.endpoints import api_blueprint
+from .api.uploads import SpoolingRequest
 from .config import settings
+from .metrics import metrics
 
 # Initialize the main Flask (WSGI) application
 app = Flask(__name__)
+# Uploads go straight to disk instead of into memory.
+app.request_class = SpoolingRequest
 
 # --- Add CORS Middleware ---
 CORS(app, origins=settings.ALLOWED_ORIGINS, supports_credentials=True)
@@ -20,3 +24,9 @@ app.register_blueprint(api_blueprint, url_prefix='/api')
 def read_root():
     """A simple health check endpoint."""
     return jsonify({"status": "ok", "message": "Parsing Service is running."})
+
+
+@app.route("/metrics")
+def read_metrics():
+    """Stage timings and message counters of this worker process, in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,101 @@
+# app/metrics.py
+#
+# In-process stage timings and counters, rendered in the Prometheus text format
+# at /metrics. Updates are a lock and a few integer adds, cheap enough to leave on.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the stage duration histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+COUNTERS = {
+    'messages_extracted': "Messages returned by the extractors.",
+    'messages_deduplicated': "Extracted messages dropped as duplicates.",
+    'timestamps_dropped': "Messages dropped because their timestamp could not be parsed.",
+    'messages_filtered': "Messages dropped by the filters sent with a parse request.",
+    'near_duplicates_folded': "Messages folded into an earlier near-duplicate (?near_duplicates=1).",
+    'bytes_processed': "Bytes of chat files read (archive members decompressed).",
+    'requests_rejected': "Parse requests turned away by admission control (429 or 503).",
+}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (stage, platform) -> bucket counts (last one is +Inf) followed by the sum
+        self._histograms = {}
+        # (counter, platform) -> value
+        self._counters = {}
+
+    def observe(self, stage: str, seconds: float, platform: str = 'all'):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get((stage, platform))
+            if histogram is None:
+                histogram = self._histograms[(stage, platform)] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def inc(self, counter: str, value: int = 1, platform: str = 'all'):
+        if not value:
+            return
+        with self._lock:
+            key = (counter, platform)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timed(self, stage: str, platform: str = 'all'):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, platform)
+
+    def drain(self) -> dict:
+        """Returns and clears everything recorded so far (used to ship worker-process metrics home)."""
+        with self._lock:
+            snapshot = {'histograms': self._histograms, 'counters': self._counters}
+            self._histograms = {}
+            self._counters = {}
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for key, values in snapshot['histograms'].items():
+                histogram = self._histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    histogram[i] += value
+            for key, value in snapshot['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            "# HELP parser_stage_duration_seconds Time spent in each parsing stage.",
+            "# TYPE parser_stage_duration_seconds histogram",
+        ]
+        for (stage, platform), values in sorted(histograms.items()):
+            labels = f'stage="{stage}",platform="{platform}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'parser_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'parser_stage_duration_seconds_sum{{{labels}}} {values[-1]}')
+            lines.append(f'parser_stage_duration_seconds_count{{{labels}}} {cumulative}')
+
+        for counter, description in COUNTERS.items():
+            lines.append(f"# HELP parser_{counter}_total {description}")
+            lines.append(f"# TYPE parser_{counter}_total counter")
+            for (name, platform), value in sorted(counters.items()):
+                if name == counter:
+                    lines.append(f'parser_{counter}_total{{platform="{platform}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
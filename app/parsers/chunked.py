@@ -0,0 +1,89 @@
+# Huge HTML exports are split at message-container boundaries and each piece is
+# parsed on its own, so peak memory follows the piece size rather than the file.
+
+import re
+
+from selectolax.parser import HTMLParser
+
+from .config import Config
+from .detector import PlatformDetector
+from .extractors import CHUNKED_EXTRACTOR_MAP
+
+# Class tokens on the opening tag of one message container, per chunkable platform.
+CONTAINER_CLASSES = {
+    'telegram': ('message',),
+    'facebook': ('_3-95', '_a6-g'),
+    'imessage': ('message',),
+    'discord': ('chat-msg',),
+}
+
+
+def container_start_re(classes) -> re.Pattern:
+    """
+    Matches a <div> opening tag whose class attribute has all of `classes`. The
+    match runs to the attribute's closing quote, so a tag cut off at the end of a
+    buffer ('<div class="chat-msg' of "chat-msg-content") is never taken for one.
+    """
+    tokens = b''.join(rb'(?=[^"\']*(?<![\w-])' + re.escape(c.encode()) + rb'(?![\w-]))' for c in classes)
+    return re.compile(rb'<div\s(?:[^>]*?\s)?class\s*=\s*["\']' + tokens + rb'[^"\']*["\']')
+
+
+_CONTAINER_START_RES = {platform: container_start_re(classes) for platform, classes in CONTAINER_CLASSES.items()}
+
+
+def _last_boundary(buffer, pattern):
+    pos = len(buffer)
+    while True:
+        pos = buffer.rfind(b'<div', 0, pos)
+        if pos <= 0:
+            return None
+        if pattern.match(buffer, pos):
+            return pos
+
+
+def split_pieces(blocks, pattern, piece_bytes: int):
+    """
+    Regroups byte blocks into pieces of at least `piece_bytes` that each end just
+    before a container's opening tag, so no container is split between pieces.
+    """
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        if len(buffer) < piece_bytes:
+            continue
+        cut = _last_boundary(buffer, pattern)
+        if cut is None:
+            # A single container bigger than a piece; keep reading until it ends.
+            continue
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+    if buffer:
+        yield bytes(buffer)
+
+
+def chunked_platform(prefix: bytes):
+    """The platform of an export from its first bytes, if it is one that can be parsed in pieces."""
+    tree = HTMLParser(prefix[:Config.CHUNK_BYTES].decode('utf-8', errors='ignore'))
+    platform = PlatformDetector.detect(tree)[0]
+    return platform if platform in CHUNKED_EXTRACTOR_MAP else None
+
+
+def iter_chunked_messages(prefix: bytes, file_obj, platform: str):
+    """
+    Yields the messages of an export whose first bytes, `prefix`, have already
+    been read from `file_obj`. Cut points never depend on the content of the
+    messages, and state such as Telegram's sender carry-over lives in the
+    extractor, so the output matches parsing the file as a single tree.
+    """
+    def blocks():
+        for start in range(0, len(prefix), Config.CHUNK_BYTES):
+            yield prefix[start:start + Config.CHUNK_BYTES]
+        while True:
+            block = file_obj.read(Config.CHUNK_BYTES)
+            if not block:
+                return
+            yield block
+
+    pieces = split_pieces(blocks(), _CONTAINER_START_RES[platform], Config.CHUNK_BYTES)
+    trees = (HTMLParser(piece.decode('utf-8', errors='ignore')) for piece in pieces)
+    return CHUNKED_EXTRACTOR_MAP[platform](trees)
@@ -1,2 +1,18 @@
 class Config:
     TARGET_FORMAT = '%Y-%m-%d %H:%M:%S'
+    # Bytes of each non-JSON file checked for chat markup before it is decoded and parsed.
+    SNIFF_BYTES = 64 * 1024
+    # Sort by k-way merging the runs each file already came in, instead of a full sort.
+    MERGE_SORTED_RUNS = False
+    # HTML files at least this big are split at message boundaries and parsed piece
+    # by piece (Telegram, Facebook, iMessage, Discord HTML); 0 always parses whole.
+    CHUNKED_PARSE_BYTES = 64 * 1024 * 1024
+    # Approximate size of each of those pieces.
+    CHUNK_BYTES = 8 * 1024 * 1024
+    # Senders counted individually by stats-only parses; further senders only add to the totals.
+    STATS_MAX_SENDERS = 10000
+    # Near-duplicate folding (?near_duplicates=1): the estimated text similarity from
+    # which a message counts as a copy of an earlier one from the same sender, and how
+    # many seconds apart the two may be.
+    NEAR_DUPLICATE_THRESHOLD = 0.8
+    NEAR_DUPLICATE_WINDOW = 60
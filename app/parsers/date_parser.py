@@ -1,14 +1,36 @@
+import calendar
 import re
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+DATETIME_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M',
+    '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M %p', '%m/%d/%y %H:%M:%S', '%m/%d/%y %I:%M:%S %p',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %I:%M:%S %p', '%d/%m/%Y %H:%M',
+    '%b %d, %Y, %I:%M %p', '%b %d, %Y %I:%M:%S %p', '%b %d, %Y  %I:%M:%S %p',
+    '%B %d, %Y, %I:%M %p', '%B %d, %Y %I:%M:%S %p', '%b %d, %Y, %H:%M:%S',
+    '%B %d, %Y, %H:%M:%S', '%b %d, %Y %H:%M:%S', '%B %d, %Y %H:%M:%S',
+    '%b %d, %Y', '%B %d, %Y', '%d-%m-%Y', '%m-%d-%Y', '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y'
+)
+
+_PAREN_SUFFIX_RE = re.compile(r'\s*\([^)]*\)\s*$')
+_AT_PREFIX_RE = re.compile(r'^\s*at\s+', re.IGNORECASE)
+_UTC_SUFFIX_RE = re.compile(r'\s*UTC.*$')
+_GMT_SUFFIX_RE = re.compile(r'\s*GMT.*$')
+_OFFSET_SUFFIX_RE = re.compile(r'\s*\+\d{4}.*$')
+
 
 def clean_timestamp(ts):
     if not ts:
         return ts
-    ts = re.sub(r'\s*\([^)]*\)\s*$', '', ts)
-    ts = re.sub(r'^\s*at\s+', '', ts, flags=re.IGNORECASE)
-    ts = re.sub(r'\s*UTC.*$', '', ts)
-    ts = re.sub(r'\s*GMT.*$', '', ts)
-    ts = re.sub(r'\s*\+\d{4}.*$', '', ts)
+    ts = _PAREN_SUFFIX_RE.sub('', ts)
+    ts = _AT_PREFIX_RE.sub('', ts)
+    ts = _UTC_SUFFIX_RE.sub('', ts)
+    ts = _GMT_SUFFIX_RE.sub('', ts)
+    ts = _OFFSET_SUFFIX_RE.sub('', ts)
     ts = ' '.join(ts.split())
     return ts
 
@@ -48,37 +70,21 @@ def parse_khmer_date(ts):
     except Exception as e:
         return None
 
-def parse_datetime_comprehensive(ts):
-    if not ts:
-        return None
 
-    ts = clean_timestamp(ts)
-    khmer_date = parse_khmer_date(ts)
-    if khmer_date:
-        return khmer_date
-
-    formats = [
-        '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%fZ',
-        '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M',
-        '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p',
-        '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M %p', '%m/%d/%y %H:%M:%S', '%m/%d/%y %I:%M:%S %p',
-        '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %I:%M:%S %p', '%d/%m/%Y %H:%M',
-        '%b %d, %Y, %I:%M %p', '%b %d, %Y %I:%M:%S %p', '%b %d, %Y  %I:%M:%S %p',
-        '%B %d, %Y, %I:%M %p', '%B %d, %Y %I:%M:%S %p', '%b %d, %Y, %H:%M:%S',
-        '%B %d, %Y, %H:%M:%S', '%b %d, %Y %H:%M:%S', '%B %d, %Y %H:%M:%S',
-        '%b %d, %Y', '%B %d, %Y', '%d-%m-%Y', '%m-%d-%Y', '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y'
-    ]
-
-    for fmt in formats:
+def _match_formats(ts):
+    for index, fmt in enumerate(DATETIME_FORMATS):
         try:
             dt = datetime.strptime(ts, fmt)
             # Basic validation to avoid default 1900 year for incomplete formats
             if dt.year == 1900 and not any(c.isdigit() for c in ts):
                 continue
-            return dt
+            return dt, index
         except ValueError:
             continue
+    return None, None
+
 
+def _parse_loose(ts):
     # Attempt to parse with a flexible regex for common patterns if direct parsing fails
     try:
         # Example: "DD Mon YYYY HH:MM:SS" or "Mon DD, YYYY HH:MM:SS AM/PM"
@@ -124,4 +130,248 @@ def parse_datetime_comprehensive(ts):
                             return datetime(year, month, day, hour, minute, second)
     except Exception:
         pass
-    return None
\ No newline at end of file
+    return None
+
+
+def _parse_comprehensive(ts):
+    """Returns (datetime, index of the winning DATETIME_FORMATS entry or None)."""
+    if not ts:
+        return None, None
+
+    ts = clean_timestamp(ts)
+    khmer_date = parse_khmer_date(ts)
+    if khmer_date:
+        return khmer_date, None
+
+    dt, index = _match_formats(ts)
+    if dt:
+        return dt, index
+    return _parse_loose(ts), None
+
+
+def parse_datetime_comprehensive(ts):
+    return _parse_comprehensive(ts)[0]
+
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+
+
+def to_epoch(dt):
+    """Whole wall-clock seconds since 1970-01-01; tzinfo is ignored, as TARGET_FORMAT output does."""
+    return (dt.replace(tzinfo=None) - _EPOCH) // _ONE_SECOND
+
+
+@lru_cache(maxsize=4096)
+def _date_prefix(days):
+    return (_EPOCH + timedelta(days=days)).strftime('%Y-%m-%d ')
+
+
+def format_epoch(epoch):
+    """Formats a to_epoch value as Config.TARGET_FORMAT ('%Y-%m-%d %H:%M:%S')."""
+    days, seconds = divmod(epoch, 86400)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return f'{_date_prefix(days)}{hour:02d}:{minute:02d}:{second:02d}'
+
+
+@lru_cache(maxsize=4096)
+def _prefix_days(prefix):
+    return (datetime.strptime(prefix, '%Y-%m-%d ') - _EPOCH).days
+
+
+def parse_epoch(formatted):
+    """The inverse of format_epoch(): '2021-03-01 09:30:00' -> 1614591000."""
+    return (_prefix_days(formatted[:11]) * 86400 + int(formatted[11:13]) * 3600
+            + int(formatted[14:16]) * 60 + int(formatted[17:19]))
+
+
+# Same patterns strptime builds for these directives (minus the rarely used
+# " 5" day form and the colon-less offsets clean_timestamp would strip), so a
+# compiled match never accepts a string strptime would reject.
+_MONTH_NUMBERS = {name.lower(): num for num, name in enumerate(calendar.month_abbr) if name}
+_MONTH_NUMBERS.update({name.lower(): num for num, name in enumerate(calendar.month_name) if name})
+
+
+def _alternation(names):
+    return '|'.join(re.escape(name.lower()) for name in sorted(names, key=len, reverse=True) if name)
+
+
+_DIRECTIVE_PATTERNS = {
+    'd': r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9])',
+    'f': r'(?P<f>[0-9]{1,6})',
+    'H': r'(?P<H>2[0-3]|[0-1]\d|\d)',
+    'I': r'(?P<I>1[0-2]|0[1-9]|[1-9])',
+    'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'M': r'(?P<M>[0-5]\d|\d)',
+    'S': r'(?P<S>6[0-1]|[0-5]\d|\d)',
+    'y': r'(?P<y>\d\d)',
+    'Y': r'(?P<Y>\d\d\d\d)',
+    'z': r'(?P<z>[+-]\d\d:[0-5]\d|(?-i:Z))',
+    'b': '(?P<b>' + _alternation(calendar.month_abbr) + ')',
+    'B': '(?P<B>' + _alternation(calendar.month_name) + ')',
+    'p': r'(?P<p>am|pm)',
+}
+
+# Directives that can match the same characters share a token, so two formats
+# with equal shapes may both accept one string.
+_SHAPE_TOKENS = {'b': 'A', 'B': 'A', 'p': 'P', 'z': 'z'}
+
+
+class CompiledFormat:
+    """A strptime format compiled to a single regex plus direct datetime construction."""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        pattern = []
+        shape = []
+        i = 0
+        while i < len(fmt):
+            char = fmt[i]
+            if char == '%':
+                directive = fmt[i + 1]
+                pattern.append(_DIRECTIVE_PATTERNS[directive])
+                shape.append(_SHAPE_TOKENS.get(directive, '#'))
+                i += 2
+            elif char.isspace():
+                while i < len(fmt) and fmt[i].isspace():
+                    i += 1
+                pattern.append(r'\s+')
+                shape.append(' ')
+            else:
+                pattern.append(re.escape(char))
+                shape.append(char.lower())
+                i += 1
+        self.regex = re.compile(''.join(pattern), re.IGNORECASE)
+        self.shape = ''.join(shape)
+
+    def parse(self, ts):
+        found = self.regex.match(ts)
+        if not found or found.end() != len(ts):
+            return None
+        fields = found.groupdict()
+
+        if 'Y' in fields:
+            year = int(fields['Y'])
+        else:
+            year = int(fields['y'])
+            year += 2000 if year <= 68 else 1900
+
+        if 'm' in fields:
+            month = int(fields['m'])
+        else:
+            month = _MONTH_NUMBERS[(fields.get('b') or fields['B']).lower()]
+
+        if 'H' in fields:
+            hour = int(fields['H'])
+        elif 'I' in fields:
+            hour = int(fields['I'])
+            if fields.get('p', '').lower() == 'pm':
+                if hour != 12:
+                    hour += 12
+            elif hour == 12:
+                hour = 0
+        else:
+            hour = 0
+
+        microsecond = 0
+        if fields.get('f'):
+            microsecond = int(fields['f'].ljust(6, '0'))
+
+        tzinfo = None
+        offset = fields.get('z')
+        if offset == 'Z':
+            tzinfo = timezone.utc
+        elif offset:
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+            tzinfo = timezone(-delta if offset[0] == '-' else delta)
+
+        try:
+            return datetime(year, month, int(fields.get('d') or 1), hour,
+                            int(fields.get('M') or 0), int(fields.get('S') or 0),
+                            microsecond, tzinfo)
+        except ValueError:
+            return None
+
+
+@lru_cache(maxsize=None)
+def _fast_path_for(index):
+    """Compiled parsers to try, in DATETIME_FORMATS order, once format `index` has been learned.
+
+    Earlier formats with the same shape are kept in front of the learned one so an
+    ambiguous string (e.g. 03/04/2021) still resolves the way parse_datetime_comprehensive would.
+    """
+    learned = CompiledFormat(DATETIME_FORMATS[index])
+    rivals = [CompiledFormat(fmt) for fmt in DATETIME_FORMATS[:index]]
+    return tuple(c for c in rivals if c.shape == learned.shape) + (learned,)
+
+
+def _quick_clean(ts):
+    """clean_timestamp, skipping the regex passes when none of them could apply."""
+    if '(' in ts or 'UTC' in ts or 'GMT' in ts or '+' in ts or ts.lstrip()[:2].lower() == 'at':
+        return clean_timestamp(ts)
+    return ts.strip()
+
+
+class TimestampNormalizer:
+    """
+    Parses the timestamps of one source (a file, an extractor's output) by learning the
+    DATETIME_FORMATS entry that wins for its first few timestamps and then matching the
+    rest against that compiled format. Misses fall back to parse_datetime_comprehensive,
+    and a run of misses makes it re-learn. Results are memoized per raw string.
+    """
+
+    def __init__(self, sample_size=8, memo_size=65536):
+        self.sample_size = sample_size
+        self.memo_size = memo_size
+        self._memo = {}
+        self._votes = Counter()
+        self._fast_path = None
+        self._hits = 0
+        self._misses = 0
+
+    def parse(self, ts):
+        if not ts:
+            return None
+        try:
+            return self._memo[ts]
+        except KeyError:
+            pass
+
+        dt = None
+        if self._fast_path:
+            candidate = _quick_clean(ts)
+            for compiled in self._fast_path:
+                dt = compiled.parse(candidate)
+                if dt:
+                    break
+
+        if dt:
+            self._hits += 1
+        else:
+            dt, index = _parse_comprehensive(ts)
+            self._learn(index)
+
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[ts] = dt
+        return dt
+
+    def _learn(self, index):
+        if index is not None:
+            self._votes[index] += 1
+        if self._fast_path is None:
+            if sum(self._votes.values()) >= self.sample_size:
+                self._adopt()
+        else:
+            self._misses += 1
+            if self._misses > self.sample_size and self._misses > self._hits:
+                self._adopt()
+
+    def _adopt(self):
+        if not self._votes:
+            return
+        index = self._votes.most_common(1)[0][0]
+        self._fast_path = _fast_path_for(index)
+        self._votes.clear()
+        self._hits = self._misses = 0
@@ -1,14 +1,37 @@
 import re
+
 from selectolax.parser import HTMLParser
 
+from .extractors.discord import find_discord_messages
+
+# Raw-byte traces of everything detect() looks for; a file with none of them
+# near the top can't be a supported export.
+_SIGNATURE_RE = re.compile(rb"_2ph_|_2pim|iMessage|history|chat-msg|pre--content|let\s+messages\s*=")
+
 class PlatformDetector:
+    @staticmethod
+    def sniff(head: bytes) -> bool:
+        """Cheap pre-check on the first bytes of a file, before any decoding or DOM building."""
+        return _SIGNATURE_RE.search(head) is not None
+
     @staticmethod
     def detect_platform(tree: HTMLParser) -> str:
+        return PlatformDetector.detect(tree)[0]
+
+    @staticmethod
+    def detect(tree: HTMLParser):
+        """
+        Returns (platform, embed). For 'discord_json_embed', embed is the located
+        `let messages = [` array so the extractor doesn't have to search again.
+        """
+        embed = find_discord_messages(tree)
+        if embed:
+            return 'discord_json_embed', embed
 
-        for script in tree.css('script'):
-            if re.search(r"let\s+messages\s*=\s*\[", script.text(strip=False)):
-                return 'discord_json_embed'
+        return PlatformDetector._detect_by_markup(tree), None
 
+    @staticmethod
+    def _detect_by_markup(tree: HTMLParser) -> str:
         if tree.css_first('div.iMessage'):
             return 'imessage'
 
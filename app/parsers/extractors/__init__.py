@@ -1,10 +1,10 @@
 # chat_parser/extractors/__init__.py
 
-from .telegram import extract_telegram
-from .facebook import extract_facebook
+from .telegram import extract_telegram, iter_telegram
+from .facebook import extract_facebook, iter_facebook
 from .instagram import extract_instagram
-from .imessage import extract_imessage
-from .discord import extract_discord_html, extract_discord_json
+from .imessage import extract_imessage, iter_imessage
+from .discord import extract_discord_html, extract_discord_json, iter_discord_html
 
 EXTRACTOR_MAP = {
     'telegram': extract_telegram,
@@ -13,4 +13,13 @@ EXTRACTOR_MAP = {
     'imessage': extract_imessage,
     'discord': extract_discord_html,
     'discord_json_embed': extract_discord_json
-}
\ No newline at end of file
+}
+
+# Extractors that can take a huge export as consecutive pieces (see parsers/chunked.py),
+# keyed like EXTRACTOR_MAP; each takes an iterable of trees and yields messages.
+CHUNKED_EXTRACTOR_MAP = {
+    'telegram': iter_telegram,
+    'facebook': iter_facebook,
+    'imessage': iter_imessage,
+    'discord': iter_discord_html,
+}
@@ -2,46 +2,79 @@ import re
 from selectolax.parser import HTMLParser
 import json
 
-def extract_discord_json(tree: HTMLParser):
-    msgs = []
+from ..records import Message
+
+_MESSAGES_START_RE = re.compile(r"let\s+messages\s*=\s*\[")
+_JSON_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
 
+def find_discord_messages(tree: HTMLParser):
+    """
+    Locates the `let messages = [` embed: returns (script_text, index of the '[')
+    for the first script that has one, or None.
+    """
     for script in tree.css('script'):
         script_text = script.text(strip=False)
-        match = re.search(r"let\s+messages\s*=\s*(\[.*?\])\s*;", script_text, re.DOTALL)
-
+        match = _MESSAGES_START_RE.search(script_text)
         if match:
-            json_string = match.group(1)
-            try:
-                data = json.loads(json_string)
-
-                for msg in data:
-                    author_info = msg.get('author', {})
-                    sender = author_info.get('username')
-                    timestamp = msg.get('timestamp')
-                    text = msg.get('content')
-
-                    if not text:
-                        if 'sticker_items' in msg and msg['sticker_items']:
-                            sticker_name = msg['sticker_items'][0].get('name')
-                            if sticker_name:
-                                text = f"Sticker: '{sticker_name}'"
-                        elif 'embeds' in msg and msg['embeds']:
-                            embed_desc = msg['embeds'][0].get('description')
-                            if embed_desc:
-                                text = embed_desc
-
-                    if sender and text:
-                        msgs.append({
-                            'source': 'Discord',
-                            'timestamp': timestamp,
-                            'sender': sender,
-                            'message': text.strip()
-                        })
-
-                break
-            except json.JSONDecodeError:
-                print("Warning: Found a script with 'let messages' but failed to decode JSON.")
-                continue
+            return script_text, match.end() - 1
+    return None
+
+
+def _convert_discord_message(msg):
+    author_info = msg.get('author', {})
+    sender = author_info.get('username')
+    timestamp = msg.get('timestamp')
+    text = msg.get('content')
+
+    if not text:
+        if 'sticker_items' in msg and msg['sticker_items']:
+            sticker_name = msg['sticker_items'][0].get('name')
+            if sticker_name:
+                text = f"Sticker: '{sticker_name}'"
+        elif 'embeds' in msg and msg['embeds']:
+            embed_desc = msg['embeds'][0].get('description')
+            if embed_desc:
+                text = embed_desc
+
+    if sender and text:
+        return Message('Discord', timestamp, sender, text.strip())
+    return None
+
+
+def iter_discord_json(script_text: str, start: int):
+    """Decodes the array at script_text[start] one message at a time, yielding converted messages."""
+    decoder = json.JSONDecoder()
+    pos = _JSON_WHITESPACE_RE.match(script_text, start + 1).end()
+    if script_text.startswith(']', pos):
+        return
+    while True:
+        msg, pos = decoder.raw_decode(script_text, pos)
+        if isinstance(msg, dict):
+            converted = _convert_discord_message(msg)
+            if converted:
+                yield converted
+        pos = _JSON_WHITESPACE_RE.match(script_text, pos).end()
+        if script_text.startswith(',', pos):
+            pos = _JSON_WHITESPACE_RE.match(script_text, pos + 1).end()
+        elif script_text.startswith(']', pos):
+            return
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", script_text, pos)
+
+
+def extract_discord_json(tree: HTMLParser, embed=None):
+    """`embed` is the (script_text, start) pair from find_discord_messages, if detection already found it."""
+    embed = embed or find_discord_messages(tree)
+    if not embed:
+        return []
+
+    msgs = []
+    try:
+        for msg in iter_discord_json(*embed):
+            msgs.append(msg)
+    except json.JSONDecodeError:
+        print("Warning: Found a script with 'let messages' but failed to decode JSON.")
 
     return msgs
 
@@ -69,11 +102,12 @@ def extract_discord_html(tree):
         text = text_div.text(strip=True) if text_div else None
 
         if text:
-            msgs.append({
-                'source': 'Discord',
-                'timestamp': timestamp,
-                'sender': sender,
-                'message': text
-            })
+            msgs.append(Message('Discord', timestamp, sender, text))
 
     return msgs
+
+
+def iter_discord_html(trees):
+    """Messages from an HTML export parsed as one tree or as consecutive pieces."""
+    for tree in trees:
+        yield from extract_discord_html(tree)
@@ -0,0 +1,253 @@
+# Declarative extraction: a platform describes its message containers and the fields
+# inside them as selectors, and extract_records() collects every field for every
+# container at once, instead of running css_first() queries container by container.
+#
+#   SPEC = ExtractorSpec(
+#       containers=['div.message'],
+#       fields={
+#           'timestamp': Field('div.date', attr='title'),
+#           'sender': Field('div.from_name', 'div.author'),       # fallback selector
+#           'text': Field(('div.body', 'div.text')),               # div.text inside div.body
+#       })
+#
+# A document can also arrive as consecutive pieces parsed separately (see
+# parsers/chunked.py); iter_records() then carries indexed pairings across pieces.
+#
+# Each distinct selector is run once over the whole document, and every match is
+# attributed to the container it sits in by walking up its parents until a known
+# node is reached. The nodes walked through are memoised, so the DOM above the
+# matches is visited about once per spec rather than once per container.
+
+from collections import deque
+
+_MISSING = object()
+
+
+class Field:
+    """
+    One value per container. Each positional argument is an alternative path, tried
+    in order until one resolves: a selector, or a tuple of selectors each matched
+    inside the previous match. As with css_first(), "inside" includes the node
+    itself. The value is the stripped text of the final node, its `attr` attribute,
+    or with exists=True whether the path resolved at all; unresolved is None.
+    With indexed=True the first selector of a path is matched over the whole
+    document and its n-th match is paired with the n-th container.
+    """
+
+    def __init__(self, *paths, attr: str = None, exists: bool = False, indexed: bool = False):
+        self.paths = [(path,) if isinstance(path, str) else tuple(path) for path in paths]
+        self.attr = attr
+        self.exists = exists
+        self.indexed = indexed
+
+    def values(self, nodes: list) -> list:
+        if self.exists:
+            return [node is not None for node in nodes]
+        if self.attr:
+            return [node.attributes.get(self.attr) if node is not None else None for node in nodes]
+        return [node.text(strip=True) if node is not None else None for node in nodes]
+
+
+class ExtractorSpec:
+    """
+    `containers` lists selectors in fallback order: the first one that matches
+    anything supplies the containers. `fields` maps record keys to Fields.
+    """
+
+    def __init__(self, containers: list, fields: dict):
+        self.containers = containers
+        self.fields = fields
+
+
+class _Scopes:
+    """Finds, for each of a list of scope nodes, the first match of a selector inside it."""
+
+    def __init__(self, nodes: list):
+        self.count = len(nodes)
+        self.slots = {}  # mem_id -> index of the scope in `nodes`
+        self.shared = {}  # mem_id -> further indices, when one node is the scope of several entries
+        for i, node in enumerate(nodes):
+            if node is None:
+                continue
+            if node.mem_id in self.slots:
+                self.shared.setdefault(node.mem_id, []).append(i)
+            else:
+                self.slots[node.mem_id] = i
+        # mem_id -> mem_id of the nearest scope at or above that node, None if there is none
+        self.nearest = dict.fromkeys(self.slots)
+        for mem_id in self.nearest:
+            self.nearest[mem_id] = mem_id
+        # scope -> the scope enclosing it, for containers nested in containers
+        self.outer = {node.mem_id: self._nearest(node.parent)
+                      for node in nodes if node is not None and node.mem_id not in self.shared}
+        for mem_id in self.shared:
+            self.outer.setdefault(mem_id, None)
+
+    def _nearest(self, node):
+        walked = []
+        while node is not None:
+            scope = self.nearest.get(node.mem_id, _MISSING)
+            if scope is not _MISSING:
+                break
+            walked.append(node.mem_id)
+            node = node.parent
+        else:
+            scope = None
+        for mem_id in walked:
+            self.nearest[mem_id] = scope
+        return scope
+
+    def first_inside(self, matches: list) -> list:
+        first = [None] * self.count
+        nearest, slots, shared, outer = self.nearest, self.slots, self.shared, self.outer
+        for node in matches:
+            # _nearest(), inlined: this loop runs once per match of every selector.
+            walked = []
+            current = node
+            while current is not None:
+                scope = nearest.get(current.mem_id, _MISSING)
+                if scope is not _MISSING:
+                    break
+                walked.append(current.mem_id)
+                current = current.parent
+            else:
+                scope = None
+            for mem_id in walked:
+                nearest[mem_id] = scope
+
+            while scope is not None:
+                i = slots[scope]
+                if first[i] is not None:
+                    # An earlier match filled this scope, and so every scope around it.
+                    break
+                first[i] = node
+                if scope in shared:
+                    for j in shared[scope]:
+                        first[j] = node
+                scope = outer[scope]
+        return first
+
+
+class _Extraction:
+    def __init__(self, tree, containers: list):
+        self.tree = tree
+        self.containers = containers
+        self.matches = {}
+        self.resolved = {}
+        self.scopes = {}
+
+    def _matches(self, selector: str) -> list:
+        if selector not in self.matches:
+            self.matches[selector] = self.tree.css(selector)
+        return self.matches[selector]
+
+    def _scopes(self, key: tuple, nodes: list) -> _Scopes:
+        if key not in self.scopes:
+            self.scopes[key] = _Scopes(nodes)
+        return self.scopes[key]
+
+    def resolve(self, path: tuple, indexed: bool) -> list:
+        """
+        The node each path leads to (None where it doesn't resolve), one per
+        container, or for indexed paths one per match of the first selector.
+        """
+        key = (indexed,) + path
+        if key in self.resolved:
+            return self.resolved[key]
+        if len(path) == 1 and indexed:
+            nodes = self._matches(path[0])
+        elif len(path) == 1:
+            nodes = self._scopes((), self.containers).first_inside(self._matches(path[0]))
+        else:
+            parents = self.resolve(path[:-1], indexed)
+            nodes = self._scopes(key[:-1], parents).first_inside(self._matches(path[-1]))
+        self.resolved[key] = nodes
+        return nodes
+
+    def field(self, field: Field) -> list:
+        nodes = [None] * len(self.containers)
+        for path in field.paths:
+            for i, node in enumerate(self.resolve(path, False)):
+                if nodes[i] is None:
+                    nodes[i] = node
+            if None not in nodes:
+                # Fallback selectors are only queried when some container still needs them.
+                break
+        return field.values(nodes)
+
+    def indexed_values(self, field: Field) -> list:
+        """Per path, the value of each match of its first selector (_MISSING where the path doesn't resolve)."""
+        columns = []
+        for path in field.paths:
+            nodes = self.resolve(path, True)
+            # Paths starting from the same selector line up match for match, so a fallback
+            # is only evaluated where the earlier paths came up empty.
+            earlier = [column for column, other in zip(columns, field.paths) if other[0] == path[0]]
+            if earlier:
+                nodes = [node if all(column[i] is _MISSING for column in earlier) else None
+                         for i, node in enumerate(nodes)]
+            columns.append([value if node is not None else _MISSING
+                            for node, value in zip(nodes, field.values(nodes))])
+        return columns
+
+
+def _containers(tree, spec: ExtractorSpec) -> list:
+    for selector in spec.containers:
+        containers = tree.css(selector)
+        if containers:
+            return containers
+    return []
+
+
+def _pair_indexed(pending: deque, queues: dict, spec: ExtractorSpec, final: bool):
+    """Fills in the indexed fields of waiting records in order, as far as the matches seen so far allow."""
+    while pending:
+        if not final and any(not queue for path_queues in queues.values() for queue in path_queues):
+            return
+        record = pending.popleft()
+        for name, path_queues in queues.items():
+            value = _MISSING
+            for queue in path_queues:
+                candidate = queue.popleft() if queue else _MISSING
+                if value is _MISSING:
+                    value = candidate
+            if value is _MISSING:
+                value = False if spec.fields[name].exists else None
+            record[name] = value
+        yield record
+
+
+def iter_records(trees, spec: ExtractorSpec):
+    """
+    Yields one {field: value} dict per container over a document given as
+    consecutive parsed pieces. Indexed fields pair the n-th container of the whole
+    document with the n-th match, whichever pieces they fall in, so a record can
+    be held back until its match arrives. Container fallbacks apply per piece.
+    """
+    names = [name for name, field in spec.fields.items() if not field.indexed]
+    queues = {name: [deque() for _ in field.paths] for name, field in spec.fields.items() if field.indexed}
+    pending = deque()
+
+    for tree in trees:
+        containers = _containers(tree, spec)
+        extraction = _Extraction(tree, containers)
+        columns = [extraction.field(spec.fields[name]) for name in names]
+        for name, path_queues in queues.items():
+            for queue, values in zip(path_queues, extraction.indexed_values(spec.fields[name])):
+                queue.extend(values)
+        del extraction
+
+        rows = zip(*columns) if columns else [()] * len(containers)
+        if queues:
+            pending.extend(dict(zip(names, values)) for values in rows)
+            yield from _pair_indexed(pending, queues, spec, final=False)
+        else:
+            for values in rows:
+                yield dict(zip(names, values))
+
+    yield from _pair_indexed(pending, queues, spec, final=True)
+
+
+def extract_records(tree, spec: ExtractorSpec):
+    """Yields one {field: value} dict per container, in the order the container query returns them."""
+    return iter_records([tree], spec)
@@ -1,43 +1,44 @@
-def extract_imessage(tree):
-    msgs = []
-
-    for div in tree.css('div.message'):
-        rec = div.css_first('div.received')
-        sent = div.css_first('div.sent')
-
-        sender = None
-        timestamp = None
-        text = None
-        source = 'iMessage'
-
-        if rec:
-            meta = rec.css_first('p')
-            if meta:
-                sender_span = meta.css_first('span.sender')
-                sender = sender_span.text(strip=True) if sender_span else 'Unknown'
-                timestamp_span = meta.css_first('span.timestamp')
-                timestamp = timestamp_span.text(strip=True) if timestamp_span else None
-                bubble = rec.css_first('span.bubble')
-                text = bubble.text(strip=True) if bubble else None
-
-        elif sent:
-            meta = sent.css_first('p')
-            if meta:
-                sender_span = meta.css_first('span.sender')
-                sender = sender_span.text(strip=True) if sender_span and sender_span.text(strip=True) != 'You' else 'Me'
-                timestamp_span = meta.css_first('span.timestamp')
-                timestamp = timestamp_span.text(strip=True) if timestamp_span else None
-                bubble = sent.css_first('span.bubble')
-                text = bubble.text(strip=True) if bubble else None
+from ..records import Message
+from .engine import ExtractorSpec, Field, iter_records
+
+
+def _side_fields(side: str) -> dict:
+    return {
+        side: Field(f'div.{side}', exists=True),
+        f'{side}_meta': Field((f'div.{side}', 'p'), exists=True),
+        f'{side}_sender': Field((f'div.{side}', 'p', 'span.sender')),
+        f'{side}_timestamp': Field((f'div.{side}', 'p', 'span.timestamp')),
+        f'{side}_text': Field((f'div.{side}', 'span.bubble')),
+    }
+
+
+IMESSAGE_SPEC = ExtractorSpec(
+    containers=['div.message'],
+    fields={**_side_fields('received'), **_side_fields('sent')})
+
+
+def iter_imessage(trees):
+    """Messages from an export parsed as one tree or as consecutive pieces."""
+    for record in iter_records(trees, IMESSAGE_SPEC):
+        if record['received']:
+            side = 'received'
+        elif record['sent']:
+            side = 'sent'
         else:
             continue
+        if not record[f'{side}_meta']:
+            continue
+
+        sender = record[f'{side}_sender']
+        if side == 'received':
+            sender = sender if sender is not None else 'Unknown'
+        else:
+            sender = sender if sender is not None and sender != 'You' else 'Me'
+        text = record[f'{side}_text']
 
         if text:
-            msgs.append({
-                'source': source,
-                'timestamp': timestamp,
-                'sender': sender,
-                'message': text
-            })
-
-    return msgs
\ No newline at end of file
+            yield Message('iMessage', record[f'{side}_timestamp'], sender, text)
+
+
+def extract_imessage(tree):
+    return list(iter_imessage([tree]))
@@ -1,45 +1,29 @@
-def extract_instagram(tree):
-    msgs = []
+from ..records import Message
+from .engine import ExtractorSpec, Field, extract_records
 
-    message_containers = tree.css('div.pam._3-95._2ph-._a6-g.uiBoxWhite.noborder, div._4tsk')
-    if not message_containers:
-        message_containers = tree.css('div[class*="message"], div[class*="msg"]')
+INSTAGRAM_SPEC = ExtractorSpec(
+    containers=[
+        'div.pam._3-95._2ph-._a6-g.uiBoxWhite.noborder, div._4tsk',
+        'div[class*="message"], div[class*="msg"]',
+    ],
+    fields={
+        'sender': Field('div._3-95._2pim._a6-h._a6-i', 'div._2pim._a6-h._a6-i',
+                        'div[class*="sender"]', 'div[class*="name"]'),
+        'text': Field('div._3-95._a6-p', 'div._a6-p', 'div[class*="content"]'),
+        'timestamp': Field('div._3-94._a6-o', 'div[class*="timestamp"]'),
+    })
 
-    for container in message_containers:
-        sender_div = (container.css_first('div._3-95._2pim._a6-h._a6-i') or
-                      container.css_first('div._2pim._a6-h._a6-i') or
-                      container.css_first('div[class*="sender"]') or
-                      container.css_first('div[class*="name"]'))
-        sender = sender_div.text(strip=True) if sender_div else None
 
+def extract_instagram(tree):
+    msgs = []
+
+    for record in extract_records(tree, INSTAGRAM_SPEC):
+        sender = record['sender']
         if not sender:
             continue
 
-        content_div = (container.css_first('div._3-95._a6-p') or
-                       container.css_first('div._a6-p') or
-                       container.css_first('div[class*="content"]'))
-        text = None
-        if content_div:
-            text = content_div.text(strip=True)
-            if not text:
-                for tag in content_div.css('p, span, div'):
-                    content = tag.text(strip=True)
-                    if content:
-                        text = content
-                        break
-
-        timestamp = None
-        ts_div = (container.css_first('div._3-94._a6-o') or
-                  container.css_first('div[class*="timestamp"]'))
-        if ts_div:
-            timestamp = ts_div.text(strip=True)
-
+        text = record['text']
         if sender and text and len(text.strip()) > 0:
-            msgs.append({
-                'source': 'Instagram',
-                'timestamp': timestamp,
-                'sender': sender,
-                'message': text.strip()
-            })
+            msgs.append(Message('Instagram', record['timestamp'], sender, text.strip()))
 
-    return msgs
\ No newline at end of file
+    return msgs
@@ -1,22 +1,28 @@
-def extract_telegram(tree):
-    msgs = []
+from ..records import Message
+from .engine import ExtractorSpec, Field, iter_records
+
+TELEGRAM_SPEC = ExtractorSpec(
+    containers=['div.message'],
+    fields={
+        'timestamp': Field('div.pull_right.date.details', attr='title'),
+        'sender': Field('div.from_name'),
+        'text': Field('div.text'),
+    })
+
+
+def iter_telegram(trees):
+    """Messages from an export parsed as one tree or as consecutive pieces."""
     last_sender = None
 
-    for div in tree.css('div.message'):
-        ts = div.css_first('div.pull_right.date.details')
-        timestamp = ts.attributes.get('title') if ts else None
-        name = div.css_first('div.from_name')
-        sender = name.text(strip=True) if name else last_sender
+    for record in iter_records(trees, TELEGRAM_SPEC):
+        # Consecutive messages from one sender ("joined") omit the name.
+        sender = record['sender'] if record['sender'] is not None else last_sender
         last_sender = sender or last_sender
-        txt = div.css_first('div.text')
-        text = txt.text(strip=True) if txt else None
+        text = record['text']
 
         if text and sender:
-            msgs.append({
-                'source': 'Telegram',
-                'timestamp': timestamp,
-                'sender': sender,
-                'message': text
-            })
+            yield Message('Telegram', record['timestamp'], sender, text)
+
 
-    return msgs
\ No newline at end of file
+def extract_telegram(tree):
+    return list(iter_telegram([tree]))
@@ -0,0 +1,91 @@
+# Filters sent with a parse request, each applied as early as the pipeline allows:
+# platforms when a file's platform is detected, senders and text before hashing,
+# and the time range right after timestamps are normalized.
+
+from datetime import datetime, timedelta
+
+from .date_parser import to_epoch
+
+# Detector keys and message sources that differ from the platform name clients use.
+_PLATFORM_ALIASES = {
+    'discord_json_embed': 'discord',
+    'discord (json)': 'discord',
+}
+
+
+def platform_name(platform_or_source: str) -> str:
+    """'Telegram', 'telegram' -> 'telegram'; 'Discord (JSON)', 'discord_json_embed' -> 'discord'."""
+    name = (platform_or_source or '').casefold()
+    return _PLATFORM_ALIASES.get(name, name)
+
+
+def _parse_bound(name: str, value: str, end_of_day: bool) -> int:
+    try:
+        dt = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r} (expected an ISO 8601 date or time, e.g. 2021-03-01 "
+                         f"or 2021-03-01T08:00:00)")
+    if end_of_day and len(value.strip()) == 10:
+        # A bare date as the upper bound includes that whole day.
+        dt += timedelta(days=1, seconds=-1)
+    return to_epoch(dt)
+
+
+class MessageFilter:
+    """
+    since/until are inclusive epoch bounds (see date_parser.to_epoch); senders,
+    platforms and contains compare case-insensitively. Unset criteria match all.
+    """
+
+    def __init__(self, since: int = None, until: int = None, senders=None, platforms=None, contains: str = None):
+        self.since = since
+        self.until = until
+        self.senders = frozenset(sender.casefold() for sender in senders) if senders else None
+        self.platforms = frozenset(platform_name(platform) for platform in platforms) if platforms else None
+        self.contains = contains.casefold() if contains else None
+
+    @classmethod
+    def from_params(cls, params):
+        """
+        From request parameters: since, until (ISO 8601), sender (repeatable),
+        platform (repeatable or comma-separated) and contains. Raises ValueError.
+        """
+        platforms = [platform.strip() for value in params.getlist('platform')
+                     for platform in value.split(',') if platform.strip()]
+        since = params.get('since')
+        until = params.get('until')
+        return cls(since=_parse_bound('since', since, False) if since else None,
+                   until=_parse_bound('until', until, True) if until else None,
+                   senders=[sender for sender in params.getlist('sender') if sender],
+                   platforms=platforms,
+                   contains=params.get('contains'))
+
+    def __bool__(self):
+        return any(criterion is not None for criterion in
+                   (self.since, self.until, self.senders, self.platforms, self.contains))
+
+    def wants_platform(self, platform: str) -> bool:
+        return self.platforms is None or platform_name(platform) in self.platforms
+
+    def keep_extracted(self, messages: list) -> list:
+        """Applies the platform, sender and text criteria to freshly extracted messages."""
+        if self.senders is None and self.platforms is None and self.contains is None:
+            return messages
+        return [msg for msg in messages if self._matches(msg)]
+
+    def _matches(self, msg) -> bool:
+        if self.platforms is not None and platform_name(msg.source) not in self.platforms:
+            return False
+        if self.senders is not None and (msg.sender or '').casefold() not in self.senders:
+            return False
+        if self.contains is not None and self.contains not in (msg.message or '').casefold():
+            return False
+        return True
+
+    def keep_in_range(self, messages: list) -> list:
+        """Applies since/until to messages whose timestamps are already epochs."""
+        if self.since is None and self.until is None:
+            return messages
+        since = self.since if self.since is not None else float('-inf')
+        until = self.until if self.until is not None else float('inf')
+        return [msg for msg in messages if since <= msg.timestamp <= until]
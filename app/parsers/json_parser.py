@@ -1,34 +1,182 @@
+import re
+import codecs
+import json
+
+from .records import Message
+
+_MESSAGE_LIST_KEYS = ('messages', 'conversation', 'chat_history')
+# What may still follow a number cut off at the end of the buffer ("1" of "1.5e+3").
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+def _is_single_message(data):
+    return all(k in data for k in ('Date', 'From', 'Content')) or \
+        all(k in data for k in ('date', 'from', 'content')) or \
+        ('timestamp' in data and 'author' in data and 'content' in data)
+
+
+def _convert_message(msg):
+    if not isinstance(msg, dict):
+        return None
+    if all(k in msg for k in ('Date', 'From', 'Content')):
+        return Message('TikTok', msg['Date'], msg['From'], msg['Content'])
+    elif all(k in msg for k in ('date', 'from', 'content')):
+        return Message('TikTok', msg['date'], msg['from'], msg['content'])
+    elif 'timestamp' in msg and 'author' in msg and 'content' in msg:
+        author = msg['author']
+        sender = author.get('username') or author.get('name') or author.get('From') or 'Unknown'
+        return Message('Discord (JSON)', msg['timestamp'], sender, msg['content'])
+    elif 'sender' in msg and 'message' in msg and 'timestamp' in msg:
+        return Message(msg.get('source', 'Generic JSON'), msg['timestamp'], msg['sender'], msg['message'])
+    return None
+
+
 def parse_generic_json(data):
     messages = []
     if not isinstance(data, list):
         if isinstance(data, dict):
-            for key in ['messages', 'conversation', 'chat_history']:
+            for key in _MESSAGE_LIST_KEYS:
                 if isinstance(data.get(key), list):
                     data = data.get(key)
                     break
             else:
-                if all(k in data for k in ('Date', 'From', 'Content')) or \
-                        all(k in data for k in ('date', 'from', 'content')) or \
-                        ('timestamp' in data and 'author' in data and 'content' in data):
+                if _is_single_message(data):
                     data = [data]
                 else:
                     return []
     for msg in data:
-        if not isinstance(msg, dict):
-            continue
-        if all(k in msg for k in ('Date', 'From', 'Content')):
-            messages.append(
-                {'source': 'TikTok', 'timestamp': msg['Date'], 'sender': msg['From'], 'message': msg['Content']})
-        elif all(k in msg for k in ('date', 'from', 'content')):
-            messages.append(
-                {'source': 'TikTok', 'timestamp': msg['date'], 'sender': msg['from'], 'message': msg['content']})
-        elif 'timestamp' in msg and 'author' in msg and 'content' in msg:
-            author = msg['author']
-            sender = author.get('username') or author.get('name') or author.get('From') or 'Unknown'
-            messages.append({'source': 'Discord (JSON)', 'timestamp': msg['timestamp'], 'sender': sender,
-                             'message': msg['content']})
-        elif 'sender' in msg and 'message' in msg and 'timestamp' in msg:
-            messages.append(
-                {'source': msg.get('source', 'Generic JSON'), 'timestamp': msg['timestamp'], 'sender': msg['sender'],
-                 'message': msg['message']})
+        converted = _convert_message(msg)
+        if converted:
+            messages.append(converted)
     return messages
+
+
+class _JsonStream:
+    """
+    Just enough of a pull parser over a UTF-8 byte stream to walk one container
+    level at a time; each value inside is decoded with json's raw_decode, so only
+    the value currently being read (plus one read chunk) is held as text.
+    """
+
+    _WHITESPACE = ' \t\n\r'
+
+    def __init__(self, file_obj, chunk_size=1 << 16):
+        self._file = file_obj
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._json = json.JSONDecoder()
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, at_least=0):
+        if self._eof:
+            return False
+        raw = self._file.read(max(self._chunk_size, at_least))
+        if not raw:
+            self._eof = True
+        text = self._decoder.decode(raw, final=self._eof)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it, '' at end of input."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def take(self, expected):
+        if self.peek() != expected:
+            raise json.JSONDecodeError(f"Expecting {expected!r}", self._buf, self._pos)
+        self._pos += 1
+
+    def expect_end(self):
+        if self.peek() != '':
+            raise json.JSONDecodeError("Extra data", self._buf, self._pos)
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(at_least=len(self._buf) - self._pos):
+                    raise
+                continue
+            # A value ending right at the buffer edge may continue in the next chunk, and
+            # so may a number followed by nothing but a cut-off ".", "e" or "e+".
+            at_edge = end == len(self._buf) or (type(obj) in (int, float)
+                                                and _NUMBER_TAIL.match(self._buf, end) is not None)
+            if at_edge and self._fill():
+                continue
+            self._pos = end
+            return obj
+
+    def array_items(self):
+        self.take('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self._pos += 1
+            else:
+                self.take(']')
+                return
+
+
+def _convert_all(items):
+    for msg in items:
+        converted = _convert_message(msg)
+        if converted:
+            yield converted
+
+
+def _iter_dict_messages(stream):
+    stream.take('{')
+    record = {}
+    streamed = False
+    if stream.peek() == '}':
+        stream.take('}')
+    else:
+        while True:
+            key = stream.value()
+            stream.take(':')
+            if not streamed and key in _MESSAGE_LIST_KEYS and stream.peek() == '[':
+                yield from _convert_all(stream.array_items())
+                streamed = True
+            else:
+                value = stream.value()
+                if not streamed:
+                    record[key] = value
+            if stream.peek() == ',':
+                stream.take(',')
+            else:
+                stream.take('}')
+                break
+    if not streamed and _is_single_message(record):
+        yield from _convert_all([record])
+
+
+def iter_generic_json(file_obj):
+    """
+    Incremental counterpart of parse_generic_json: yields converted messages while
+    reading `file_obj`, recognising a top-level list, a dict holding the list under
+    messages/conversation/chat_history, or a single message dict. When several of
+    those keys hold lists, the first one in the document is used.
+    """
+    stream = _JsonStream(file_obj)
+    first = stream.peek()
+    if first == '[':
+        yield from _convert_all(stream.array_items())
+    elif first == '{':
+        yield from _iter_dict_messages(stream)
+    else:
+        stream.value()
+    stream.expect_end()
@@ -1,69 +1,266 @@
-import json
-from datetime import datetime
+import os
+import heapq
+import time
+from operator import attrgetter
 
 from selectolax.parser import HTMLParser
 
+from ..metrics import metrics
+from .chunked import chunked_platform, iter_chunked_messages
 from .config import Config
-from .date_parser import parse_datetime_comprehensive
+from .date_parser import TimestampNormalizer, to_epoch, format_epoch
 from .detector import PlatformDetector
 from .extractors import EXTRACTOR_MAP
-from .json_parser import parse_generic_json
-from .utils import generate_message_hash
+from .json_parser import iter_generic_json
+from .utils import generate_message_digests
 
 
-def process_single_file(file_obj, seen_hashes: set):
-    unique_msgs_from_this_file = []
+def _bytes_read(file_obj) -> int:
+    try:
+        return file_obj.tell()
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _file_size(file_obj):
+    """The size of a file: `file_size` set on a ZIP member by its caller, else from the file system."""
+    size = getattr(file_obj, 'file_size', None)
+    if size is None:
+        try:
+            size = os.fstat(file_obj.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            return None
+    return size
+
+
+def _skip_platform(platform: str, filters, filename: str) -> bool:
+    if filters is None or filters.wants_platform(platform):
+        return False
+    print(f"Skipping {platform.replace('_', ' ').title()} file {filename}: platform filtered out.")
+    return True
+
+
+def extract_messages(file_obj, filters=None):
+    """
+    Detects the platform of one file and returns everything its extractor found.
+    A file whose platform `filters` (a MessageFilter) excludes is not extracted.
+    """
     filename = getattr(file_obj, 'filename', getattr(file_obj, 'name', 'unknown_file'))
     extracted_messages = []
+    platform = 'json'
 
     try:
         if filename.lower().endswith('.json'):
-            content = file_obj.read().decode('utf-8', errors='ignore')
-            extracted_messages = parse_generic_json(json.loads(content))
+            # Decoded straight from the byte stream, one message at a time.
+            with metrics.timed('extract', platform):
+                extracted_messages = list(iter_generic_json(file_obj))
+            metrics.inc('bytes_processed', _bytes_read(file_obj), platform)
         else:
-            content = file_obj.read().decode('utf-8', errors='ignore')
-            tree = HTMLParser(content)
-            platform = PlatformDetector.detect_platform(tree)
-            extractor_func = EXTRACTOR_MAP.get(platform)
+            start = time.perf_counter()
+            head = file_obj.read(Config.SNIFF_BYTES)
+            if not PlatformDetector.sniff(head):
+                metrics.observe('read', time.perf_counter() - start, 'skipped')
+                metrics.inc('bytes_processed', len(head), 'skipped')
+                print(f"Warning: No chat markup found in {filename}. Skipping.")
+                return []
+            raw = head
+            platform = None
+            size = _file_size(file_obj)
+            if Config.CHUNKED_PARSE_BYTES and (size is None or size >= Config.CHUNKED_PARSE_BYTES):
+                # Only the first piece is read to tell whether the platform can be parsed in pieces.
+                raw = b''.join((head, file_obj.read(max(Config.CHUNK_BYTES - len(head), 0))))
+                platform = chunked_platform(raw)
 
-            if extractor_func:
+            if platform and _skip_platform(platform, filters, filename):
+                return []
+            if platform:
+                # Too big for one tree: parsed at message boundaries, one piece at a time.
+                metrics.observe('read', time.perf_counter() - start, platform)
+                with metrics.timed('extract', platform):
+                    extracted_messages = list(iter_chunked_messages(raw, file_obj, platform))
+                metrics.inc('bytes_processed', _bytes_read(file_obj) or len(raw), platform)
                 platform_name = platform.replace('_', ' ').title()
-                extracted_messages = extractor_func(tree)
-                print(f"Detected {platform_name} in {filename}, extracted {len(extracted_messages)} messages.")
+                print(f"Detected {platform_name} in {filename} (parsed in pieces), "
+                      f"extracted {len(extracted_messages)} messages.")
             else:
-                print(f"Warning: Unknown or unsupported format in {filename}. Skipping.")
+                raw += file_obj.read()
+                content = raw.decode('utf-8', errors='ignore')
+                read_done = time.perf_counter()
+                tree = HTMLParser(content)
+                dom_done = time.perf_counter()
+                platform, embed = PlatformDetector.detect(tree)
+                metrics.observe('read', read_done - start, platform)
+                metrics.observe('dom', dom_done - read_done, platform)
+                metrics.observe('detect', time.perf_counter() - dom_done, platform)
+                metrics.inc('bytes_processed', len(raw), platform)
+                if _skip_platform(platform, filters, filename):
+                    return []
+                extractor_func = EXTRACTOR_MAP.get(platform)
+
+                if extractor_func:
+                    platform_name = platform.replace('_', ' ').title()
+                    with metrics.timed('extract', platform):
+                        extracted_messages = extractor_func(tree, embed) if embed else extractor_func(tree)
+                    print(f"Detected {platform_name} in {filename}, extracted {len(extracted_messages)} messages.")
+                else:
+                    print(f"Warning: Unknown or unsupported format in {filename}. Skipping.")
 
     except Exception as e:
         print(f"Error processing file {filename}: {e}")
         return []
 
-    for msg in extracted_messages:
-        if not msg.get('message'):
-             continue
-        content_hash = generate_message_hash(msg)
-        if content_hash not in seen_hashes:
-            seen_hashes.add(content_hash)
-            unique_msgs_from_this_file.append(msg)
+    metrics.inc('messages_extracted', len(extracted_messages), platform)
+    return extracted_messages
 
-    return unique_msgs_from_this_file
 
-def deduplicate_and_sort_messages(unique_messages_list: list):
-    if not unique_messages_list:
-        return []
+def keep_unseen_messages(extracted_messages, seen_hashes, filters=None):
+    """
+    Drops empty messages, those `filters` (a MessageFilter) rejects on sender,
+    platform or text, and any whose digest is already in seen_hashes (a
+    DigestSet, or any set), recording the rest.
+    """
+    start = time.perf_counter()
+    candidates = [msg for msg in extracted_messages if msg.message]
+    if filters:
+        kept = filters.keep_extracted(candidates)
+        metrics.inc('messages_filtered', len(candidates) - len(kept))
+        candidates = kept
+    digests = generate_message_digests(candidates)
+
+    add_new = getattr(seen_hashes, 'add_new', None)
+    if add_new:
+        fresh = add_new(digests)
+    else:
+        fresh = []
+        for digest in digests:
+            fresh.append(digest not in seen_hashes)
+            seen_hashes.add(digest)
+
+    unique_msgs = [msg for msg, is_new in zip(candidates, fresh) if is_new]
+    metrics.observe('hash', time.perf_counter() - start)
+    metrics.inc('messages_deduplicated', len(candidates) - len(unique_msgs))
+    return unique_msgs
+
+
+def process_single_file(file_obj, seen_hashes, filters=None):
+    return keep_unseen_messages(extract_messages(file_obj, filters), seen_hashes, filters)
+
 
+_TIMESTAMP_KEY = attrgetter('timestamp')
+
+
+def _sorted_runs(messages: list, keys: list) -> list:
+    """
+    Splits messages into maximal non-decreasing runs, reversing strictly decreasing
+    ones (exports like Facebook's list newest first), as timsort does.
+    Returns (first key, last key, run) tuples in input order.
+    """
+    runs = []
+    start = 0
+    n = len(keys)
+    while start < n:
+        end = start + 1
+        if end < n and keys[end] < keys[start]:
+            while end < n and keys[end] < keys[end - 1]:
+                end += 1
+            runs.append((keys[end - 1], keys[start], messages[start:end][::-1]))
+        else:
+            while end < n and keys[end] >= keys[end - 1]:
+                end += 1
+            runs.append((keys[start], keys[end - 1], messages[start:end]))
+        start = end
+    return runs
+
+
+def _merge_sorted_runs(messages: list, key, max_runs: int = 256) -> list:
+    """
+    Stable sort by merging the already sorted runs: runs that don't overlap (one file
+    per time span) are just concatenated, overlapping ones are k-way merged. Falls
+    back to list.sort when the input has too many runs to be worth it.
+    """
+    runs = _sorted_runs(messages, [key(msg) for msg in messages])
+    if len(runs) > max_runs:
+        messages.sort(key=key)
+        return messages
+
+    order = sorted(range(len(runs)), key=lambda i: runs[i][0])
+    disjoint = all(
+        runs[b][0] > runs[a][1] or (runs[b][0] == runs[a][1] and a < b)
+        for a, b in zip(order, order[1:])
+    )
+    if disjoint:
+        merged = []
+        for i in order:
+            merged.extend(runs[i][2])
+        return merged
+    return list(heapq.merge(*(run for _, _, run in runs), key=key))
+
+
+def normalize_timestamps(messages: list, normalizers: dict = None) -> list:
+    """
+    Replaces each message's timestamp with an integer epoch, learning the timestamp
+    format per source. Messages whose timestamp can't be parsed are dropped.
+    Pass the same `normalizers` dict to carry what was learned across calls.
+    """
     standardized = []
-    for msg in unique_messages_list:
-        dt = parse_datetime_comprehensive(msg.get('timestamp', ''))
+    # Each source tends to stick to one timestamp format, so learn it per source.
+    normalizers = {} if normalizers is None else normalizers
+    for msg in messages:
+        source = msg.source
+        normalizer = normalizers.get(source)
+        if normalizer is None:
+            normalizer = normalizers[source] = TimestampNormalizer()
+        dt = normalizer.parse(msg.timestamp)
         if dt:
-            msg['timestamp'] = dt.strftime(Config.TARGET_FORMAT)
+            msg.timestamp = to_epoch(dt)
             standardized.append(msg)
+    return standardized
 
-    def sort_key(msg):
-        try:
-            return datetime.strptime(msg.get('timestamp'), Config.TARGET_FORMAT)
-        except (ValueError, TypeError):
-            return datetime.min
 
-    standardized.sort(key=sort_key)
+def sort_normalized(messages: list, merge: bool = None) -> list:
+    """
+    Sorts epoch-stamped messages: a full sort, or a k-way merge of per-file runs
+    with merge=True / Config.MERGE_SORTED_RUNS.
+    """
+    if Config.MERGE_SORTED_RUNS if merge is None else merge:
+        return _merge_sorted_runs(messages, _TIMESTAMP_KEY)
+    messages.sort(key=_TIMESTAMP_KEY)
+    return messages
+
+
+def format_timestamps(messages: list) -> list:
+    """Turns epoch timestamps back into Config.TARGET_FORMAT strings, in place."""
+    for msg in messages:
+        msg.timestamp = format_epoch(msg.timestamp)
+    return messages
+
+
+def deduplicate_and_sort_messages(unique_messages_list: list, merge: bool = None, filters=None,
+                                  near_duplicates=None, format_output: bool = True):
+    """
+    Normalizes every timestamp to an integer epoch, sorts on it and formats the
+    output string once per message at the end. The time range of `filters`
+    is applied as soon as the epochs are known, before sorting. With
+    `near_duplicates` (a NearDuplicateFolder) near-duplicates are folded once
+    the messages are in time order. format_output=False leaves the epochs.
+    """
+    if not unique_messages_list:
+        return []
 
-    return standardized
\ No newline at end of file
+    with metrics.timed('normalize'):
+        standardized = normalize_timestamps(unique_messages_list)
+    metrics.inc('timestamps_dropped', len(unique_messages_list) - len(standardized))
+    if filters:
+        in_range = filters.keep_in_range(standardized)
+        metrics.inc('messages_filtered', len(standardized) - len(in_range))
+        standardized = in_range
+    with metrics.timed('sort'):
+        standardized = sort_normalized(standardized, merge)
+    if near_duplicates:
+        with metrics.timed('fold'):
+            standardized = near_duplicates.fold(standardized)
+        metrics.inc('near_duplicates_folded', near_duplicates.folded)
+    if not format_output:
+        return standardized
+    with metrics.timed('format'):
+        return format_timestamps(standardized)
@@ -0,0 +1,194 @@
+# Optional folding of near-duplicate messages: the same conversation exported from
+# two platforms, re-exported with timestamps a few seconds apart, or a message sent
+# again with small changes. Exact duplicates are gone by then (keep_unseen_messages).
+#
+# Every message gets a MinHash signature over character shingles of its normalized
+# text, computed with one-permutation hashing: each shingle is hashed once and the
+# signature is the smallest hash in each of num_perm equal slices of the hash range
+# (empty slices borrow from the next non-empty one). The signature is cut into bands,
+# and messages are indexed by (sender, band) in buckets that only hold the last
+# `window` seconds of messages. A message is compared with the few messages it
+# shares a bucket with rather than with all the others, so time grows linearly and
+# memory with the busiest window, not with the export.
+
+import re
+import math
+from itertools import repeat
+from operator import rshift
+from zlib import crc32
+
+from .config import Config
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_text(text) -> str:
+    """Case, punctuation and spacing folded away: 'Good  morning!!' -> 'good morning'."""
+    return _SEPARATORS.sub(' ', str(text).casefold()).strip()
+
+
+def _sender_key(sender) -> str:
+    return _SEPARATORS.sub('', sender.casefold()) if sender else ''
+
+
+def _parse_number(name: str, value: str, cast, low, high):
+    try:
+        number = cast(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r} (expected a number)")
+    if not low <= number <= high:
+        raise ValueError(f"Invalid {name}: {value!r} (expected {low} to {high})")
+    return number
+
+
+class NearDuplicateFolder:
+    """
+    Drops each message whose estimated text similarity (Jaccard index of the
+    shingle sets) with a kept message from the same sender, at most `window`
+    seconds earlier, is at least `threshold`; the earliest of a group is kept.
+    Messages that differ only in case, punctuation or spacing always fold,
+    including short ones such as "ok" sent twice within the window.
+    """
+
+    def __init__(self, threshold: float = None, window: int = None, num_perm: int = 32, bands: int = 8,
+                 shingle_size: int = 4):
+        self.threshold = Config.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        self.window = Config.NEAR_DUPLICATE_WINDOW if window is None else window
+        if not 0 < self.threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        if num_perm & (num_perm - 1) or num_perm % bands:
+            raise ValueError("num_perm must be a power of two and a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Signatures agreeing on at least this many of their num_perm values match.
+        self._min_agreement = math.ceil(self.threshold * num_perm)
+        self._slice_bits = 32 - (num_perm.bit_length() - 1)
+        self.folded = 0  # by the last fold()
+
+    @classmethod
+    def from_params(cls, params):
+        """From request parameters near_duplicate_threshold (0-1) and near_duplicate_window (seconds)."""
+        threshold = params.get('near_duplicate_threshold')
+        window = params.get('near_duplicate_window')
+        return cls(threshold=_parse_number('near_duplicate_threshold', threshold, float, 0.01, 1) if threshold
+                   else None,
+                   window=_parse_number('near_duplicate_window', window, int, 0, 7 * 86400) if window else None)
+
+    def signature(self, text) -> list:
+        # Messages of nothing but emoji or punctuation are compared as they are.
+        normalized = normalize_text(text) or str(text).strip()
+        width = self.shingle_size
+        if len(normalized) <= width:
+            hashes = [crc32(normalized.encode('utf-8'))]
+        else:
+            # Fixed four bytes per character, so every shingle is one slice of the same length.
+            data = normalized.encode('utf-32-le')
+            width *= 4
+            hashes = sorted(map(crc32, [data[i:i + width] for i in range(0, len(data) - width + 4, 4)]),
+                            reverse=True)
+        # Largest first, so the hash each slice of the range ends up with is its smallest.
+        smallest = dict(zip(map(rshift, hashes, repeat(self._slice_bits)), hashes))
+        signature = list(map(smallest.get, range(self.num_perm)))
+        if len(smallest) < self.num_perm:
+            # Densify: an empty slice takes the value of the next non-empty one (wrapping
+            # around), tagged with the distance so it never equals a value of its own.
+            num_perm = self.num_perm
+            borrowed, distance = None, 0
+            for i in range(2 * num_perm - 1, -1, -1):
+                value = signature[i % num_perm]
+                if value is not None:
+                    borrowed, distance = value, 0
+                else:
+                    distance += 1
+                    if i < num_perm:
+                        signature[i] = borrowed | distance << 32
+        return signature
+
+    def _band_keys(self, sender: str, signature: list) -> list:
+        rows = self.rows
+        return [(sender, band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def fold(self, messages: list) -> list:
+        """
+        Returns the messages that are not near-duplicates of an earlier one.
+        `messages` must be sorted by their epoch timestamps.
+        """
+        window = self.window
+        current, previous = _Window(), _Window()
+        current_window = None
+        sender_keys = {}
+        kept = []
+        for msg in messages:
+            timestamp = msg.timestamp
+            window_id = timestamp // window if window else timestamp
+            if window_id != current_window:
+                consecutive = current_window is not None and window_id == current_window + 1
+                previous = current if consecutive else _Window()
+                current = _Window()
+                current_window = window_id
+
+            sender = sender_keys.get(msg.sender)
+            if sender is None:
+                sender = sender_keys[msg.sender] = _sender_key(msg.sender)
+            if sender not in current.senders and sender not in previous.senders:
+                # Nothing to compare with: signed only if another message from the sender comes close.
+                current.add_unsigned(sender, timestamp, msg.message)
+                kept.append(msg)
+                continue
+
+            for recent in (current, previous):
+                for seen_at, text in recent.unsigned.pop(sender, ()):
+                    other = self.signature(text)
+                    recent.add(self._band_keys(sender, other), seen_at, other)
+            signature = self.signature(msg.message)
+            keys = self._band_keys(sender, signature)
+            if self._has_match(keys, signature, timestamp, current, previous):
+                continue
+            kept.append(msg)
+            current.add(keys, timestamp, signature)
+            current.senders.add(sender)
+        self.folded = len(messages) - len(kept)
+        return kept
+
+    def _has_match(self, keys, signature, timestamp, current, previous) -> bool:
+        window, min_agreement = self.window, self._min_agreement
+        for recent in (current, previous):
+            buckets = recent.buckets
+            for key in keys:
+                for seen_at, other in buckets.get(key, ()):
+                    if timestamp - seen_at > window:
+                        continue
+                    agreement = sum(a == b for a, b in zip(signature, other))
+                    if agreement >= min_agreement:
+                        return True
+        return False
+
+
+class _Window:
+    """
+    The kept messages of one `window`-second stretch: the LSH buckets, and the
+    messages not signed yet because no other message from their sender came near.
+    """
+
+    __slots__ = ('buckets', 'unsigned', 'senders')
+
+    def __init__(self):
+        self.buckets = {}  # (sender, band, the band's signature values) -> [(timestamp, signature)]
+        self.unsigned = {}  # sender -> [(timestamp, text)]
+        self.senders = set()
+
+    def add(self, keys: list, timestamp: int, signature: list):
+        entry = (timestamp, signature)
+        buckets = self.buckets
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [entry]
+            else:
+                bucket.append(entry)
+
+    def add_unsigned(self, sender: str, timestamp: int, text):
+        self.unsigned.setdefault(sender, []).append((timestamp, text))
+        self.senders.add(sender)
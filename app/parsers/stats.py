@@ -0,0 +1,99 @@
+# Statistics gathered while messages stream through the pipeline, for parses that
+# only want the numbers: each deduplicated batch is normalized, counted and
+# dropped, so the message list is never materialized, sorted or serialized.
+
+from .config import Config
+from .date_parser import format_epoch
+from .main_parser import normalize_timestamps
+from ..metrics import metrics
+
+
+class MessageStats:
+    """
+    Counts per sender, platform, day and hour of day over messages whose timestamps
+    are already epochs. At most Config.STATS_MAX_SENDERS senders are counted
+    individually; messages from further senders are only counted in total, so
+    memory stays bounded whatever the export looks like.
+    """
+
+    def __init__(self, max_senders: int = None):
+        self.max_senders = max_senders or Config.STATS_MAX_SENDERS
+        self.total = 0
+        self.senders = {}
+        self.untracked_senders = 0  # messages from senders beyond max_senders
+        self.platforms = {}
+        self.days = {}  # days since the epoch -> messages
+        self.hours = [0] * 24
+        self.first = None
+        self.last = None
+
+    def add_all(self, messages: list):
+        senders, platforms, days, hours = self.senders, self.platforms, self.days, self.hours
+        for msg in messages:
+            sender = msg.sender
+            if sender in senders:
+                senders[sender] += 1
+            elif len(senders) < self.max_senders:
+                senders[sender] = 1
+            else:
+                self.untracked_senders += 1
+            source = msg.source
+            platforms[source] = platforms.get(source, 0) + 1
+            day, seconds = divmod(msg.timestamp, 86400)
+            days[day] = days.get(day, 0) + 1
+            hours[seconds // 3600] += 1
+        if messages:
+            epochs = [msg.timestamp for msg in messages]
+            low, high = min(epochs), max(epochs)
+            self.first = low if self.first is None else min(self.first, low)
+            self.last = high if self.last is None else max(self.last, high)
+        self.total += len(messages)
+
+    def to_dict(self, filename: str) -> dict:
+        by_sender = {}
+        for sender, count in self.senders.items():
+            # The sender can be missing (None); it is listed as Unknown.
+            name = 'Unknown' if sender is None else sender
+            by_sender[name] = by_sender.get(name, 0) + count
+        return {
+            "total_messages": self.total,
+            # A lower bound once more than max_senders senders were seen.
+            "unique_senders": len(self.senders),
+            "senders_truncated": self.untracked_senders > 0,
+            "file_processed": filename,
+            "first_timestamp": format_epoch(self.first) if self.first is not None else None,
+            "last_timestamp": format_epoch(self.last) if self.last is not None else None,
+            "by_sender": dict(sorted(by_sender.items(), key=lambda item: -item[1])),
+            "by_platform": {str(source): count for source, count in
+                            sorted(self.platforms.items(), key=lambda item: -item[1])},
+            "by_day": {format_epoch(day * 86400)[:10]: count for day, count in sorted(self.days.items())},
+            "by_hour": self.hours,
+        }
+
+
+class StatsCollector:
+    """
+    Stands in for the list of deduplicated messages: each batch extended into it is
+    normalized (sharing the learned timestamp formats across batches, as one
+    normalize_timestamps() call over the whole list would), range-filtered and
+    counted, then let go. len() is the number of messages received, for progress.
+    """
+
+    def __init__(self, filters=None):
+        self.filters = filters
+        self.stats = MessageStats()
+        self.received = 0
+        self._normalizers = {}
+
+    def __len__(self):
+        return self.received
+
+    def extend(self, messages: list):
+        self.received += len(messages)
+        standardized = normalize_timestamps(messages, self._normalizers)
+        metrics.inc('timestamps_dropped', len(messages) - len(standardized))
+        if self.filters:
+            in_range = self.filters.keep_in_range(standardized)
+            metrics.inc('messages_filtered', len(standardized) - len(in_range))
+            standardized = in_range
+        self.stats.add_all(standardized)
@@ -1,8 +1,87 @@
 import hashlib
+from array import array
 
-def generate_message_hash(message: dict) -> str:
-    ts = str(message.get('timestamp', ''))
-    sender = str(message.get('sender', ''))
-    message_content = str(message.get('message', ''))
-    unique_string = f"{ts}{sender}{message_content}"
-    return hashlib.sha256(unique_string.encode('utf-8')).hexdigest()
\ No newline at end of file
+def generate_message_digests(messages) -> list:
+    """
+    64-bit digests of each message's timestamp+sender+message string, for a whole
+    extractor batch in one call. 0 is reserved as DigestSet's empty slot.
+    """
+    blake2b = hashlib.blake2b
+    from_bytes = int.from_bytes
+    return [
+        from_bytes(blake2b(f"{msg.timestamp}{msg.sender}{msg.message}"
+                           .encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        for msg in messages
+    ]
+
+
+class DigestSet:
+    """
+    Set of 64-bit message digests kept in one flat array('Q') with linear probing,
+    about 8 bytes per slot instead of a Python str/int object plus a set entry.
+    """
+
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity: int = 1024):
+        size = 1 << max(int(capacity / self.MAX_LOAD), 8).bit_length()
+        self._table = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+        self._limit = int(size * self.MAX_LOAD)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, digest: int) -> bool:
+        table = self._table
+        mask = self._mask
+        i = digest & mask
+        while True:
+            slot = table[i]
+            if slot == digest:
+                return True
+            if not slot:
+                return False
+            i = (i + 1) & mask
+
+    def add(self, digest: int) -> bool:
+        """Adds one digest; returns True if it was not already present."""
+        return self.add_new([digest])[0]
+
+    def add_new(self, digests) -> list:
+        """Adds a batch of digests, returning for each whether it was new (in order)."""
+        digests = list(digests)
+        while self._len + len(digests) > self._limit:
+            self._grow()
+        table = self._table
+        mask = self._mask
+        fresh = []
+        append = fresh.append
+        for digest in digests:
+            i = digest & mask
+            while True:
+                slot = table[i]
+                if slot == digest:
+                    append(False)
+                    break
+                if not slot:
+                    table[i] = digest
+                    append(True)
+                    break
+                i = (i + 1) & mask
+        self._len += fresh.count(True)
+        return fresh
+
+    def _grow(self):
+        old = self._table
+        size = len(old) * 2
+        self._table = table = array('Q', bytes(8 * size))
+        self._mask = mask = size - 1
+        self._limit = int(size * self.MAX_LOAD)
+        for digest in old:
+            if digest:
+                i = digest & mask
+                while table[i]:
+                    i = (i + 1) & mask
+                table[i] = digest
@@ -0,0 +1,127 @@
+# Size and encode-time benchmark for the response encodings (app/logic/encoding.py):
+# a large parse result encoded in every format (JSON, NDJSON, columnar NDJSON,
+# columnar MessagePack), plain and gzip/zstd-compressed, as the streaming responses
+# produce it. Reports bytes, seconds, MB/s of JSON-equivalent output and peak memory
+# over the result itself, against jsonify-style encoding of the whole document at once.
+#
+#   python -m benchmarks.encodings --sizes 100000,1000000
+#   python -m benchmarks.encodings --sizes 1000000 --formats columnar,msgpack --output enc.json
+
+import json
+import time
+import argparse
+
+from app.config import settings
+from app.parsers.date_parser import format_epoch
+from app.logic.encoding import (MSGPACK_AVAILABLE, CONTENT_ENCODINGS, iter_json, iter_ndjson, iter_columnar,
+                                iter_msgpack, iter_compressed)
+
+from .near_duplicates import generate_messages
+from .runner import _reset_peak_rss, _peak_rss_mb
+
+FORMATS = ('json', 'ndjson', 'columnar', 'msgpack')
+
+
+def make_result(n: int, seed: int = 0) -> dict:
+    """A parse result of n messages from 50 senders on 5 platforms, timestamps formatted."""
+    messages, _ = generate_messages(n, duplicate_rate=0, seed=seed)
+    for msg in messages:
+        msg.timestamp = format_epoch(msg.timestamp)
+    return {"messages": messages, "statistics": {"total_messages": n, "file_processed": "bench.zip"}}
+
+
+def _chunks(result: dict, response_format: str, compression: str):
+    chunk_size = settings.NDJSON_CHUNK_SIZE
+    if response_format == 'json':
+        chunks = iter_json(result, chunk_size=chunk_size)
+    else:
+        encoder = {'ndjson': iter_ndjson, 'columnar': iter_columnar, 'msgpack': iter_msgpack}[response_format]
+        chunks = encoder(result["messages"], result["statistics"], chunk_size=chunk_size)
+    if compression != 'none':
+        level = settings.GZIP_LEVEL if compression == 'gzip' else settings.ZSTD_LEVEL
+        chunks = iter_compressed(chunks, compression, level)
+    return chunks
+
+
+def _jsonify(result: dict):
+    # What jsonify() did before responses were streamed: the whole document as one string.
+    document = {"messages": [msg.to_dict() for msg in result["messages"]], "statistics": result["statistics"]}
+    yield (json.dumps(document, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _measure(chunks) -> dict:
+    _reset_peak_rss()
+    base_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in chunks)
+    elapsed = time.perf_counter() - start
+    return {'bytes': size, 'seconds': round(elapsed, 3), 'extra_rss_mb': round(_peak_rss_mb() - base_rss, 1)}
+
+
+def decode_columnar(lines) -> tuple:
+    """Messages (as dicts) and statistics back from iter_columnar() lines, as a client would."""
+    sources, senders, messages = [], [], []
+    statistics = None
+    epoch = 0
+    for line in lines:
+        block = json.loads(line)
+        if "statistics" in block:
+            statistics = block["statistics"]
+            continue
+        sources.extend(block["sources"])
+        senders.extend(block["senders"])
+        for source, sender, delta, text in zip(block["source"], block["sender"], block["timestamp"],
+                                               block["message"]):
+            epoch += delta
+            messages.append({'source': sources[source], 'timestamp': format_epoch(epoch),
+                             'sender': senders[sender], 'message': text})
+    return messages, statistics
+
+
+def bench(n: int, formats, compressions, seed: int = 0) -> dict:
+    result = make_result(n, seed)
+    columnar = b''.join(iter_columnar(result["messages"], result["statistics"]))
+    decoded, _ = decode_columnar(columnar.decode('utf-8').splitlines())
+    assert decoded == [msg.to_dict() for msg in result["messages"]], "columnar round trip failed"
+    del columnar, decoded
+
+    run = {'messages': n, 'jsonify': _measure(_jsonify(result)), 'encodings': {}}
+    for response_format in formats:
+        for compression in compressions:
+            run['encodings'][f'{response_format}+{compression}'] = _measure(_chunks(result, response_format,
+                                                                                    compression))
+    return run
+
+
+def _print_run(run: dict):
+    baseline = run['jsonify']
+    rows = [('jsonify', baseline)] + list(run['encodings'].items())
+    for name, r in rows:
+        print(f"{run['messages']:>10,}  {name:<18}{r['bytes'] / 1e6:>10.1f}{r['bytes'] / baseline['bytes']:>8.1%}"
+              f"{r['seconds']:>10.2f}{baseline['bytes'] / 1e6 / r['seconds']:>10.1f}{r['extra_rss_mb']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark response encodings on a large parse result.")
+    parser.add_argument('--sizes', default='100000,1000000', help="comma-separated message counts")
+    parser.add_argument('--formats', default=','.join(name for name in FORMATS
+                                                      if name != 'msgpack' or MSGPACK_AVAILABLE))
+    parser.add_argument('--compressions', default=','.join(('none',) + CONTENT_ENCODINGS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    formats, compressions = args.formats.split(','), args.compressions.split(',')
+    print(f"{'messages':>10}  {'encoding':<18}{'MB':>10}{'size':>8}{'seconds':>10}{'MB/s':>10}{'+RSS MB':>10}")
+    runs = []
+    for n in (int(size) for size in args.sizes.split(',')):
+        runs.append(bench(n, formats, compressions, args.seed))
+        _print_run(runs[-1])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(runs, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+# Synthetic exports in the shapes each extractor expects, written incrementally so
+# even multi-million-message files never have to exist in memory as one string.
+
+import io
+import json
+import random
+import zipfile
+from datetime import datetime, timedelta
+from html import escape
+
+SENDERS = ['Alice Martin', 'Bob', 'Sokha Chan', 'Dara', 'María José', 'user_4821']
+WORDS = ['hey', 'ok', 'see you tomorrow', 'lunch?', 'haha', 'sure thing', 'on my way',
+         'សួស្តី', 'អរគុណ', '😂', '👍', 'https://example.com/a?b=1&c=2', '<not a tag>',
+         'did you get the file', 'call me later', 'Good morning!', 'ខ្ញុំនៅផ្ទះ']
+
+START = datetime(2021, 3, 1, 8, 0, 0)
+
+
+def _text(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+
+
+def _timestamps(rng, n, newest_first=False):
+    current = START
+    stamps = []
+    for _ in range(n):
+        current += timedelta(seconds=rng.randint(5, 900))
+        stamps.append(current)
+    return stamps[::-1] if newest_first else stamps
+
+
+def _telegram(out, n, rng):
+    out.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Exported Data</title>'
+              '<link href="css/style.css" rel="stylesheet"/></head><body><div class="page_wrap">'
+              '<div class="page_header"><div class="content"><div class="text bold">Chat</div></div></div>'
+              '<div class="page_body chat_page"><div class="history">')
+    last_sender = None
+    for i, ts in enumerate(_timestamps(rng, n)):
+        sender = last_sender if last_sender and rng.random() < 0.4 else rng.choice(SENDERS)
+        joined = sender == last_sender
+        out.write(f'<div class="message default clearfix{" joined" if joined else ""}" id="message{i}">'
+                  f'<div class="pull_left userpic_wrap"></div><div class="body">'
+                  f'<div class="pull_right date details" title="{ts:%d.%m.%Y %H:%M:%S} UTC+07:00">{ts:%H:%M}</div>')
+        if not joined:
+            out.write(f'<div class="from_name">{escape(sender)}</div>')
+        out.write(f'<div class="text">{escape(_text(rng))}</div></div></div>')
+        last_sender = sender
+    out.write('</div></div></div></body></html>')
+
+
+def _facebook(out, n, rng):
+    out.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Chat</title></head><body class="_5vb_ _2yq _a7o5">'
+              '<div class="clearfix _ikh"><div class="_4bl9"><div class="_li"><div class="_a705"><div class="_a706" role="main">')
+    for ts in _timestamps(rng, n, newest_first=True):
+        out.write(f'<div class="pam _3-95 _2ph- _a6-g uiBoxWhite noborder">'
+                  f'<div class="_2ph_ _a6-h _a6-i">{escape(rng.choice(SENDERS))}</div>'
+                  f'<div class="_2ph_ _a6-p"><div><div></div><div>{escape(_text(rng))}</div><div></div><div></div></div></div>'
+                  f'<div class="_3-94 _a6-o"><div class="_a72d">{ts:%b %d, %Y %I:%M:%S %p}</div></div></div>')
+    out.write('</div></div></div></div></div></body></html>')
+
+
+def _instagram(out, n, rng):
+    out.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Chat</title></head><body class="_5vb_ _2yq _a7o5">'
+              '<div class="_a706" role="main">')
+    for ts in _timestamps(rng, n, newest_first=True):
+        out.write(f'<div class="pam _3-95 _2ph- _a6-g uiBoxWhite noborder">'
+                  f'<div class="_3-95 _2pim _a6-h _a6-i">{escape(rng.choice(SENDERS))}</div>'
+                  f'<div class="_3-95 _a6-p"><div><div></div><div>{escape(_text(rng))}</div><div></div></div></div>'
+                  f'<div class="_3-94 _a6-o">{ts:%b %d, %Y %I:%M %p}</div></div>')
+    out.write('</div></body></html>')
+
+
+def _imessage(out, n, rng):
+    out.write('<html><head><meta charset="utf-8"></head><body><div class="iMessage">')
+    for ts in _timestamps(rng, n):
+        side, sender = ('received', rng.choice(SENDERS)) if rng.random() < 0.5 else ('sent', 'You')
+        out.write(f'<div class="message"><div class="{side}"><p><span class="timestamp">{ts:%b %d, %Y %I:%M:%S %p}</span>'
+                  f'<span class="sender">{escape(sender)}</span></p><span class="bubble">{escape(_text(rng))}</span></div></div>')
+    out.write('</div></body></html>')
+
+
+def _discord_html(out, n, rng):
+    out.write('<html><head><meta charset="utf-8"></head><body><div class="chat-area">')
+    for ts in _timestamps(rng, n):
+        out.write(f'<div class="chat-msg"><div class="chat-msg-profile"><div class="chat-msg-date">'
+                  f'<span>{escape(rng.choice(SENDERS))}</span> {ts:%m/%d/%Y %I:%M %p}</div></div>'
+                  f'<div class="chat-msg-content"><div class="chat-msg-text">{escape(_text(rng))}</div></div></div>')
+    out.write('</div></body></html>')
+
+
+def _discord_message(i, ts, rng):
+    msg = {'id': str(10 ** 17 + i), 'type': 0, 'channel_id': '123',
+           'author': {'id': str(rng.randint(1, 10 ** 9)), 'username': rng.choice(SENDERS)},
+           'timestamp': f'{ts:%Y-%m-%dT%H:%M:%S}.{rng.randint(0, 999999):06d}+00:00',
+           'content': _text(rng), 'attachments': [], 'mentions': []}
+    roll = rng.random()
+    if roll < 0.03:
+        msg['content'] = ''
+        msg['sticker_items'] = [{'id': '1', 'name': 'wave', 'format_type': 1}]
+    elif roll < 0.06:
+        msg['content'] = ''
+        msg['embeds'] = [{'type': 'link', 'description': 'Shared link ]; with tricky text'}]
+    return msg
+
+
+def _discord_json_embed(out, n, rng):
+    out.write('<!DOCTYPE html><html><head><meta charset="utf-8"><script>window.config = {theme: "dark"};</script>'
+              '<script>\nlet messages = [')
+    for i, ts in enumerate(_timestamps(rng, n)):
+        if i:
+            out.write(',\n')
+        out.write(json.dumps(_discord_message(i, ts, rng), ensure_ascii=False))
+    out.write('];\nrender(messages);\n</script></head><body><div id="app"></div></body></html>')
+
+
+def _tiktok_json(out, n, rng):
+    out.write('[')
+    for i, ts in enumerate(_timestamps(rng, n)):
+        if i:
+            out.write(', ')
+        out.write(json.dumps({'Date': f'{ts:%Y-%m-%d %H:%M:%S}', 'From': rng.choice(SENDERS), 'Content': _text(rng)},
+                             ensure_ascii=False))
+    out.write(']')
+
+
+def _discord_json(out, n, rng):
+    out.write('{"guild": {"id": "1", "name": "Server"}, "channel": {"id": "123", "type": "GuildTextChat"}, "messages": [')
+    for i, ts in enumerate(_timestamps(rng, n)):
+        if i:
+            out.write(',\n')
+        out.write(json.dumps(_discord_message(i, ts, rng), ensure_ascii=False))
+    out.write(f'], "messageCount": {n}}}')
+
+
+# name -> (writer, file name used inside archives)
+GENERATORS = {
+    'telegram': (_telegram, 'messages.html'),
+    'facebook': (_facebook, 'message_1.html'),
+    'instagram': (_instagram, 'message_1.html'),
+    'imessage': (_imessage, 'chat.html'),
+    'discord': (_discord_html, 'chat.html'),
+    'discord_json_embed': (_discord_json_embed, 'export.html'),
+    'tiktok_json': (_tiktok_json, 'messages.json'),
+    'discord_json': (_discord_json, 'messages.json'),
+}
+
+
+def write_export(platform: str, n: int, out, seed: int = 0):
+    """Writes an `n`-message export for `platform` to the text stream `out`."""
+    writer, _ = GENERATORS[platform]
+    writer(out, n, random.Random(seed))
+
+
+def export_filename(platform: str) -> str:
+    return GENERATORS[platform][1]
+
+
+def generate_export(platform: str, n: int, seed: int = 0) -> bytes:
+    out = io.StringIO()
+    write_export(platform, n, out, seed)
+    return out.getvalue().encode('utf-8')
+
+
+def write_archive(path, platforms, members: int, messages_per_member: int, seed: int = 0, noise: int = 0):
+    """
+    Writes a ZIP with `members` chat files spread over `platforms` (one folder per
+    conversation, as real exports do) plus `noise` non-chat members (CSS, images).
+    """
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(members):
+            platform = platforms[i % len(platforms)]
+            name = f'{platform}/inbox/conversation_{i}/{export_filename(platform)}'
+            with archive.open(name, 'w') as raw:
+                with io.TextIOWrapper(raw, encoding='utf-8') as out:
+                    write_export(platform, messages_per_member, out, seed=seed + i)
+        for i in range(noise):
+            if i % 2:
+                archive.writestr(f'files/style_{i}.css', '.x{color:#333;margin:0 auto}\n' * 2000)
+            else:
+                archive.writestr(f'photos/photo_{i}.jpg', rng.randbytes(40_000))
@@ -0,0 +1,158 @@
+# Load test for a running server: concurrent clients upload a mix of small chat
+# files and large archives, and the run reports throughput, status codes (including
+# admission-control rejections) and latency percentiles per upload class.
+#
+#   gunicorn -c gunicorn.conf.py app.main:app
+#   python -m benchmarks.loadtest --url http://127.0.0.1:8000 --clients 16 --duration 60
+#   python -m benchmarks.loadtest --large-ratio 0.3 --query 'format=ndjson' --output load.json
+
+import io
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from .generators import generate_export, write_archive
+
+
+def _multipart(filename: str, data: bytes):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def build_payloads(small_messages: int, large_members: int, large_messages: int, seed: int = 0) -> dict:
+    """name -> (multipart body, content type): one single-file export and one multi-platform archive."""
+    archive = io.BytesIO()
+    write_archive(archive, ['telegram', 'facebook', 'instagram', 'imessage', 'discord_json'],
+                  large_members, large_messages // large_members, seed=seed)
+    return {
+        'small': _multipart('messages.html', generate_export('telegram', small_messages, seed)),
+        'large': _multipart('export.zip', archive.getvalue()),
+    }
+
+
+def _percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class LoadTest:
+    def __init__(self, url: str, payloads: dict, large_ratio: float, query: str = '', seed: int = 0,
+                 honor_retry_after: bool = True):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = '/api/parse' + (f'?{query}' if query else '')
+        self.payloads = payloads
+        self.large_ratio = large_ratio
+        self.seed = seed
+        self.honor_retry_after = honor_retry_after
+        self.samples = []  # (class, status, seconds, bytes sent)
+        self._lock = threading.Lock()
+
+    def _client(self, index: int, deadline: float, limit: int):
+        rng = random.Random(self.seed + index)
+        while time.monotonic() < deadline:
+            with self._lock:
+                if limit and len(self.samples) >= limit:
+                    break
+            name = 'large' if rng.random() < self.large_ratio else 'small'
+            body, content_type = self.payloads[name]
+            retry_after = None
+            # A connection per upload: idle keep-alive connections are closed by the server
+            # while a client backs off, and uploads are too big for reuse to matter.
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=3600)
+            start = time.perf_counter()
+            try:
+                conn.request('POST', self.path, body=body, headers={'Content-Type': content_type})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                retry_after = response.getheader('Retry-After')
+            except (OSError, http.client.HTTPException):
+                status = 0  # connection error
+            finally:
+                conn.close()
+            with self._lock:
+                self.samples.append((name, status, time.perf_counter() - start, len(body)))
+            if retry_after and self.honor_retry_after:
+                # As a well-behaved client would: back off for as long as the server asked.
+                time.sleep(max(0.0, min(float(retry_after), deadline - time.monotonic())))
+
+    def run(self, clients: int, duration: float, requests: int = 0) -> dict:
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self._client, args=(i, deadline, requests)) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> dict:
+        classes = {}
+        for name in ('small', 'large', 'all'):
+            samples = [s for s in self.samples if name in ('all', s[0])]
+            ok = sorted(seconds for _, status, seconds, _ in samples if status == 200)
+            statuses = {}
+            for _, status, _, _ in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            classes[name] = {
+                'requests': len(samples),
+                'statuses': statuses,
+                'ok_per_s': round(len(ok) / elapsed, 2),
+                'uploaded_mb_per_s': round(sum(size for _, status, _, size in samples if status == 200)
+                                           / 1e6 / elapsed, 2),
+                'latency_s': {label: round(value, 3) if value is not None else None for label, value in
+                              (('p50', _percentile(ok, 0.50)), ('p90', _percentile(ok, 0.90)),
+                               ('p99', _percentile(ok, 0.99)), ('max', ok[-1] if ok else None))},
+            }
+        return {'elapsed_s': round(elapsed, 2), 'classes': classes}
+
+
+def _print_report(report: dict):
+    print(f"\n{'class':<7}{'requests':>10}{'ok/s':>8}{'MB/s':>8}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}  statuses")
+    for name, r in report['classes'].items():
+        latency = [f"{v:>8.2f}" if v is not None else f"{'-':>8}" for v in r['latency_s'].values()]
+        print(f"{name:<7}{r['requests']:>10}{r['ok_per_s']:>8.2f}{r['uploaded_mb_per_s']:>8.2f}"
+              f"{''.join(latency)}  {r['statuses']}")
+    print(f"elapsed {report['elapsed_s']}s (status 0 = connection error)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent mixed-size upload load test against /api/parse.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--clients', type=int, default=8, help="concurrent client connections")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to keep sending")
+    parser.add_argument('--requests', type=int, default=0, help="stop after this many requests (0: no limit)")
+    parser.add_argument('--large-ratio', type=float, default=0.1, help="share of uploads that are the large archive")
+    parser.add_argument('--small-messages', type=int, default=2000)
+    parser.add_argument('--large-messages', type=int, default=200000, help="messages in the large archive")
+    parser.add_argument('--large-members', type=int, default=20, help="chat files in the large archive")
+    parser.add_argument('--query', default='', help="query string for /api/parse, e.g. format=ndjson")
+    parser.add_argument('--ignore-retry-after', action='store_true',
+                        help="resend at once after a 429/503 instead of waiting as told")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    payloads = build_payloads(args.small_messages, args.large_members, args.large_messages, args.seed)
+    for name, (body, _) in payloads.items():
+        print(f"{name}: {len(body) / 1e6:.1f} MB upload")
+    report = LoadTest(args.url, payloads, args.large_ratio, args.query, args.seed,
+                      honor_retry_after=not args.ignore_retry_after).run(args.clients, args.duration, args.requests)
+    _print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+# Scaling benchmark for near-duplicate folding (app/parsers/near_duplicates.py):
+# synthetic conversations with a known share of injected near-duplicates (other
+# platform, shifted timestamp, changed case, punctuation or a word), folded at
+# growing sizes. Reports throughput, peak memory, and precision/recall against
+# the injected copies; small sizes are also run through a naive all-pairs
+# comparison to show the quadratic cost the index avoids.
+#
+#   python -m benchmarks.near_duplicates --sizes 10000,100000,1000000
+#   python -m benchmarks.near_duplicates --sizes 5000000 --naive-max 0 --output nd.json
+
+import json
+import time
+import random
+import argparse
+
+from app.parsers.near_duplicates import NearDuplicateFolder, normalize_text
+from app.parsers.records import Message
+
+from .generators import WORDS
+from .runner import _reset_peak_rss, _peak_rss_mb
+
+SOURCES = ['Telegram', 'Facebook', 'Instagram', 'iMessage', 'Discord']
+START_EPOCH = 1614585600  # 2021-03-01
+
+
+def _variant(rng, text: str) -> str:
+    """The text as another export or a resend would have it."""
+    choice = rng.randrange(5)
+    words = text.split(' ')
+    if choice == 0:
+        return text.upper() if rng.random() < 0.5 else text.capitalize()
+    if choice == 1:
+        return text + rng.choice(['!', '...', ' 👍', ' 😂', ' ?'])
+    if choice == 2:
+        return '  '.join(words)
+    if choice == 3 and len(words) >= 8:
+        del words[rng.randrange(len(words))]
+        return ' '.join(words)
+    return text.replace(' ', ', ', 1)
+
+
+def generate_messages(n: int, duplicate_rate: float = 0.1, senders: int = 50, seed: int = 0):
+    """
+    n messages in time order (epoch timestamps), of which about duplicate_rate are
+    near-duplicates of an earlier message. Senders write in bursts of messages a few
+    seconds apart, as in real chats. Returns (messages, ids of the copies).
+    """
+    rng = random.Random(seed)
+    names = [f'Sender {i}' for i in range(senders)]
+    messages = []
+    copies = set()
+    pending = []  # (timestamp, copy) waiting to be placed in time order
+    timestamp = START_EPOCH
+    sender = names[0]
+    while len(messages) < n:
+        if rng.random() < 0.6:
+            timestamp += rng.randint(1, 20)
+        else:
+            timestamp += rng.randint(1, 600)
+            sender = rng.choice(names)
+        while pending and pending[0][0] <= timestamp and len(messages) < n:
+            messages.append(pending.pop(0)[1])
+        if len(messages) >= n:
+            break
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 16)))
+        msg = Message(rng.choice(SOURCES), timestamp, sender, text)
+        messages.append(msg)
+        if rng.random() < duplicate_rate:
+            copy = Message(rng.choice(SOURCES), timestamp + rng.randint(0, 30),
+                           msg.sender.lower() if rng.random() < 0.3 else msg.sender, _variant(rng, text))
+            copies.add(id(copy))
+            pending.append((copy.timestamp, copy))
+            pending.sort(key=lambda item: item[0])
+    return messages, copies
+
+
+def _shingles(text: str, size: int = 4) -> frozenset:
+    normalized = normalize_text(text) or text.strip()
+    if len(normalized) <= size:
+        return frozenset([normalized])
+    return frozenset(normalized[i:i + size] for i in range(len(normalized) - size + 1))
+
+
+def naive_fold(messages: list, threshold: float, window: int) -> list:
+    """Exact Jaccard of every message against every kept one: the quadratic baseline."""
+    kept = []
+    for msg in messages:
+        shingles = _shingles(msg.message)
+        sender = normalize_text(msg.sender or '').replace(' ', '')
+        if not any(other_sender == sender and msg.timestamp - other.timestamp <= window
+                   and len(shingles & other_shingles) >= threshold * len(shingles | other_shingles)
+                   for other, other_sender, other_shingles in kept):
+            kept.append((msg, sender, shingles))
+    return [msg for msg, _, _ in kept]
+
+
+def _measure(fold, messages: list, copies: set) -> dict:
+    _reset_peak_rss()
+    base_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    kept = fold(messages)
+    elapsed = time.perf_counter() - start
+    extra_rss = _peak_rss_mb() - base_rss
+    kept_ids = set(map(id, kept))
+    folded = [msg for msg in messages if id(msg) not in kept_ids]
+    correct = sum(1 for msg in folded if id(msg) in copies)
+    return {
+        'seconds': round(elapsed, 3),
+        'messages_per_s': round(len(messages) / elapsed, 1) if elapsed else None,
+        # Over what the messages themselves take.
+        'extra_rss_mb': round(extra_rss, 1),
+        'folded': len(folded),
+        'precision': round(correct / len(folded), 4) if folded else None,
+        'recall': round(correct / len(copies), 4) if copies else None,
+    }
+
+
+def bench(n: int, duplicate_rate: float, threshold: float, window: int, naive_max: int, seed: int = 0) -> dict:
+    messages, copies = generate_messages(n, duplicate_rate, seed=seed)
+    run = {'messages': n, 'injected': len(copies),
+           'lsh': _measure(NearDuplicateFolder(threshold, window).fold, messages, copies)}
+    if n <= naive_max:
+        run['naive'] = _measure(lambda m: naive_fold(m, threshold, window), messages, copies)
+    return run
+
+
+def _print_run(run: dict):
+    for method in ('lsh', 'naive'):
+        r = run.get(method)
+        if r:
+            print(f"{run['messages']:>10,}  {method:<6}{r['seconds']:>10.2f}{r['messages_per_s']:>12,.0f}"
+                  f"{r['extra_rss_mb']:>10.1f}{r['folded']:>10,}{run['injected']:>10,}"
+                  f"{r['precision'] or 0:>10.3f}{r['recall'] or 0:>8.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate folding against injected copies.")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="comma-separated message counts")
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help="share of messages copied once")
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--window', type=int, default=60)
+    parser.add_argument('--naive-max', type=int, default=20000, help="largest size also run all-pairs (0: never)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    print(f"{'messages':>10}  {'method':<6}{'seconds':>10}{'msg/s':>12}{'+RSS MB':>10}{'folded':>10}"
+          f"{'injected':>10}{'precision':>10}{'recall':>8}")
+    runs = []
+    for n in (int(size) for size in args.sizes.split(',')):
+        runs.append(bench(n, args.duplicate_rate, args.threshold, args.window, args.naive_max, args.seed))
+        _print_run(runs[-1])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(runs, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
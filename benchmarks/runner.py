@@ -0,0 +1,243 @@
+# Per-stage throughput and peak-memory benchmarks over synthetic exports.
+#
+#   python -m benchmarks.runner --sizes 1000,100000 --output run.json
+#   python -m benchmarks.runner --sizes 100000 --compare run.json
+#   python -m benchmarks.runner --archive 40x5000 --platforms facebook,instagram
+#   python -m benchmarks.runner --check-chunked
+
+import os
+
+# Benchmarks measure parsing, not the result cache.
+os.environ.setdefault('CACHE_ENABLED', '0')
+
+import io
+import json
+import contextlib
+import time
+import argparse
+import tempfile
+import resource
+
+from selectolax.parser import HTMLParser
+
+from app.config import settings
+from app.parsers.config import Config
+from app.parsers.detector import PlatformDetector
+from app.parsers.extractors import EXTRACTOR_MAP
+from app.parsers.json_parser import iter_generic_json
+from app.parsers.chunked import CONTAINER_CLASSES
+from app.parsers.main_parser import extract_messages, keep_unseen_messages, normalize_timestamps, sort_normalized, format_timestamps
+from app.parsers.utils import DigestSet
+from app.logic.encoding import iter_ndjson
+from app.logic.tasks import parse_file_and_get_results
+
+from .generators import GENERATORS, generate_export, write_archive, export_filename
+
+STAGES = ('detect', 'extract', 'hash', 'normalize', 'sort', 'serialize')
+
+
+def _reset_peak_rss():
+    """Resets the kernel's high-water mark so each stage reports its own peak (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTimer:
+    def __init__(self, size_bytes: int):
+        self.size_bytes = size_bytes
+        self.results = {}
+
+    def run(self, stage: str, count: int, func, *args):
+        _reset_peak_rss()
+        start = time.perf_counter()
+        value = func(*args)
+        elapsed = time.perf_counter() - start
+        self.results[stage] = {
+            'seconds': round(elapsed, 4),
+            'messages_per_s': round(count / elapsed, 1) if elapsed else None,
+            'mb_per_s': round(self.size_bytes / 1e6 / elapsed, 2) if elapsed else None,
+            'peak_rss_mb': round(_peak_rss_mb(), 1),
+        }
+        return value
+
+
+def _detect(data: bytes):
+    if not PlatformDetector.sniff(data[:Config.SNIFF_BYTES]):
+        return None, None, None
+    tree = HTMLParser(data.decode('utf-8', errors='ignore'))
+    platform, embed = PlatformDetector.detect(tree)
+    return tree, platform, embed
+
+
+def _extract(tree, platform, embed):
+    extractor_func = EXTRACTOR_MAP[platform]
+    return extractor_func(tree, embed) if embed else extractor_func(tree)
+
+
+def _serialize(messages: list) -> int:
+    format_timestamps(messages)
+    return sum(len(chunk) for chunk in iter_ndjson(messages, {}, settings.NDJSON_CHUNK_SIZE))
+
+
+def bench_platform(platform: str, n: int, seed: int = 0) -> dict:
+    data = generate_export(platform, n, seed)
+    timer = StageTimer(len(data))
+
+    if export_filename(platform).endswith('.json'):
+        # JSON members skip detection entirely.
+        extracted = timer.run('extract', n, lambda: list(iter_generic_json(io.BytesIO(data))))
+    else:
+        tree, detected, embed = timer.run('detect', n, _detect, data)
+        if not detected or detected == 'unknown':
+            raise RuntimeError(f"{platform} export was not detected (got {detected!r})")
+        extracted = timer.run('extract', n, _extract, tree, detected, embed)
+        del tree
+
+    unique = timer.run('hash', len(extracted), keep_unseen_messages, extracted, DigestSet())
+    normalized = timer.run('normalize', len(unique), normalize_timestamps, unique)
+    ordered = timer.run('sort', len(normalized), sort_normalized, normalized)
+    timer.run('serialize', len(ordered), _serialize, ordered)
+
+    return {'platform': platform, 'messages': n, 'extracted': len(extracted), 'output': len(ordered),
+            'bytes': len(data), 'stages': timer.results}
+
+
+def bench_archive(platforms, members: int, per_member: int, workers: int, seed: int = 0) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.zip')
+        write_archive(path, platforms, members, per_member, seed=seed, noise=members)
+        with open(path, 'rb') as f:
+            data = f.read()
+    timer = StageTimer(len(data))
+    result = timer.run('end_to_end', members * per_member, parse_file_and_get_results, data, 'export.zip', workers)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return {'platform': f"archive[{','.join(platforms)}] {members}x{per_member} w{workers}",
+            'messages': members * per_member, 'output': result['statistics']['total_messages'],
+            'bytes': len(data), 'stages': timer.results}
+
+
+def _extract_file(data: bytes, filename: str, parse_bytes: int, chunk_bytes: int) -> list:
+    saved = Config.CHUNKED_PARSE_BYTES, Config.CHUNK_BYTES
+    Config.CHUNKED_PARSE_BYTES, Config.CHUNK_BYTES = parse_bytes, chunk_bytes
+    file_obj = io.BytesIO(data)
+    file_obj.filename = filename
+    file_obj.file_size = len(data)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [msg.to_dict() for msg in extract_messages(file_obj)]
+    finally:
+        Config.CHUNKED_PARSE_BYTES, Config.CHUNK_BYTES = saved
+
+
+def check_chunked(n: int, chunk_sizes=(333, 997, 4096, 20000), seed: int = 0) -> list:
+    """
+    Parses an export of every platform that can be split into pieces both whole and
+    in pieces of each of `chunk_sizes` bytes (small, so cuts land everywhere), and
+    lists the combinations whose messages differ.
+    """
+    mismatches = []
+    for platform in CONTAINER_CLASSES:
+        data = generate_export(platform, n, seed)
+        filename = export_filename(platform)
+        whole = _extract_file(data, filename, 0, Config.CHUNK_BYTES)
+        for chunk_bytes in chunk_sizes:
+            pieces = _extract_file(data, filename, chunk_bytes, chunk_bytes)
+            if pieces != whole:
+                mismatches.append(f"{platform} n={n} pieces of {chunk_bytes} bytes: "
+                                  f"{len(pieces):,} messages, {len(whole):,} parsed whole")
+    return mismatches
+
+
+def compare(current: list, baseline: list, threshold: float) -> list:
+    """Flags stages whose throughput dropped, or whose peak RSS grew, by more than `threshold`."""
+    previous = {(run['platform'], run['messages']): run for run in baseline}
+    regressions = []
+    for run in current:
+        before = previous.get((run['platform'], run['messages']))
+        if not before:
+            continue
+        for stage, now in run['stages'].items():
+            old = before['stages'].get(stage)
+            if not old:
+                continue
+            if old['messages_per_s'] and now['messages_per_s'] and \
+                    now['messages_per_s'] < old['messages_per_s'] * (1 - threshold):
+                regressions.append(f"{run['platform']} n={run['messages']} {stage}: "
+                                   f"{old['messages_per_s']:,.0f} -> {now['messages_per_s']:,.0f} msg/s")
+            if now['peak_rss_mb'] > old['peak_rss_mb'] * (1 + threshold):
+                regressions.append(f"{run['platform']} n={run['messages']} {stage}: "
+                                   f"peak RSS {old['peak_rss_mb']} -> {now['peak_rss_mb']} MB")
+    return regressions
+
+
+def _print_run(run: dict):
+    print(f"\n{run['platform']}  messages={run['messages']:,}  size={run['bytes'] / 1e6:.1f} MB  output={run['output']:,}")
+    print(f"  {'stage':<11}{'seconds':>10}{'msg/s':>14}{'MB/s':>10}{'peak RSS MB':>14}")
+    for stage, r in run['stages'].items():
+        print(f"  {stage:<11}{r['seconds']:>10.3f}{r['messages_per_s'] or 0:>14,.0f}"
+              f"{r['mb_per_s'] or 0:>10.1f}{r['peak_rss_mb']:>14.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every extractor and pipeline stage on synthetic exports.")
+    parser.add_argument('--platforms', default='all', help=f"comma-separated subset of: {', '.join(GENERATORS)}")
+    parser.add_argument('--sizes', default='1000,100000', help="comma-separated message counts (1k to 5M)")
+    parser.add_argument('--archive', help="also run an end-to-end ZIP benchmark, MEMBERSxMESSAGES (e.g. 40x5000)")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes for the archive benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative change that counts as a regression")
+    parser.add_argument('--check-chunked', action='store_true',
+                        help="only check that parsing in small pieces matches parsing whole, then exit")
+    args = parser.parse_args(argv)
+
+    if args.check_chunked:
+        mismatches = check_chunked(2000, seed=args.seed)
+        print(f"{len(mismatches)} chunked parse mismatch(es)")
+        for line in mismatches:
+            print(f"  {line}")
+        return 1 if mismatches else 0
+
+    platforms = list(GENERATORS) if args.platforms == 'all' else args.platforms.split(',')
+    runs = []
+    for n in (int(size) for size in args.sizes.split(',')):
+        for platform in platforms:
+            runs.append(bench_platform(platform, n, args.seed))
+            _print_run(runs[-1])
+    if args.archive:
+        members, per_member = (int(x) for x in args.archive.lower().split('x'))
+        runs.append(bench_archive(platforms, members, per_member, args.workers, args.seed))
+        _print_run(runs[-1])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(runs, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(runs, json.load(f), args.threshold)
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        for line in regressions:
+            print(f"  {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,39 @@
+# Production serving: `gunicorn -c gunicorn.conf.py app.main:app`.
+#
+# The app is imported once in the master (preload_app), so the parser modules are
+# loaded before forking and every worker shares the admission budget created at
+# import time (app/api/admission.py). Each worker serves a few requests on threads;
+# parses beyond the budget queue or are rejected there rather than piling up here.
+
+import os
+
+# Requests run in parallel across workers, so each parse stays in its own process
+# instead of fanning out to a per-worker pool as well.
+os.environ.setdefault("PARSE_WORKERS", "1")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 4))
+preload_app = True
+timeout = int(os.environ.get("WEB_TIMEOUT", 1200))
+# WEB_MAX_REQUESTS recycles each worker after that many requests, so memory fragmented
+# by big parses goes back to the OS. Off by default: a recycled worker takes its running
+# background jobs down with it (they are reported as failed).
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def child_exit(server, worker):
+    # A worker killed mid-parse (OOM, timeout) never released its share of the budget.
+    from app.api.admission import admission
+    if admission:
+        admission.reclaim(worker.pid)
+
+
+def post_request(worker, req, environ, resp):
+    # An early error response left a big body unread (see _discard_body): close the
+    # connection rather than let keep-alive read the rest of the upload.
+    if environ.get('parser.close_connection'):
+        req.force_close()
@@ -0,0 +1,118 @@
+# Huge HTML exports parsed in pieces (app/parsers/chunked.py): pieces are only
+# cut before a real container's opening tag, wherever the blocks read from the
+# file happen to end, and the messages match parsing the file as one tree.
+
+import io
+
+import pytest
+
+from app.parsers.chunked import CONTAINER_CLASSES, _CONTAINER_START_RES, container_start_re, split_pieces
+from app.parsers.config import Config
+from app.parsers.main_parser import extract_messages
+from benchmarks import generators
+
+# One container's opening tag per platform, as the exports write it.
+OPENING_TAGS = {
+    'telegram': b'<div class="message default clearfix joined" id="message12">',
+    'facebook': b'<div class="pam _3-95 _2ph- _a6-g uiBoxWhite noborder">',
+    'imessage': b'<div class="message">',
+    'discord': b'<div class="chat-msg">',
+}
+
+# Message text that looks like markup; the exports escape it, as real ones do.
+LOOKALIKE_WORDS = generators.WORDS + [
+    '<div class="message">', '<div class="chat-msg">', '<div class="pam _3-95 _a6-g">',
+    'class="message"', "class='chat-msg'", '<div', 'chat-msg-content',
+]
+
+
+@pytest.fixture
+def lookalike_text(monkeypatch):
+    monkeypatch.setattr(generators, 'WORDS', LOOKALIKE_WORDS)
+
+
+def _starts(data: bytes, platform: str) -> set:
+    pattern = _CONTAINER_START_RES[platform]
+    return {pos for pos in range(len(data)) if data.startswith(b'<div', pos) and pattern.match(data, pos)}
+
+
+def _blocks(data: bytes, size: int):
+    return (data[start:start + size] for start in range(0, len(data), size))
+
+
+@pytest.mark.parametrize('platform', sorted(CONTAINER_CLASSES))
+def test_opening_tag_matches(platform):
+    tag = OPENING_TAGS[platform]
+    assert _CONTAINER_START_RES[platform].match(tag)
+    assert _CONTAINER_START_RES[platform].match(tag.replace(b'"', b"'"))
+
+
+@pytest.mark.parametrize('platform', sorted(CONTAINER_CLASSES))
+def test_tag_cut_before_its_closing_quote_does_not_match(platform):
+    tag = OPENING_TAGS[platform]
+    closing_quote = tag.index(b'"', tag.index(b'class="') + len(b'class="'))
+    pattern = _CONTAINER_START_RES[platform]
+    for end in range(closing_quote + 1):
+        assert not pattern.match(tag[:end]), tag[:end]
+
+
+@pytest.mark.parametrize('tag', [
+    b'<div class="chat-msg-content">', b'<div class="chat-msg-text">', b'<div class="x-chat-msg">',
+    b'<div class="messages">', b'<div class="message_wrap">', b'<div data-class="message">',
+    b'<span class="chat-msg">', b'<div class="_3-95 _a6-h">',
+])
+def test_lookalike_tags_do_not_match(tag):
+    assert not any(pattern.match(tag) for pattern in _CONTAINER_START_RES.values())
+
+
+def test_classes_match_in_any_order():
+    pattern = container_start_re(('_3-95', '_a6-g'))
+    assert pattern.match(b'<div id="m" class="_a6-g pam _3-95">')
+    assert not pattern.match(b'<div class="_a6-g pam">')
+
+
+def test_block_ending_mid_tag_is_not_cut():
+    # The first block ends inside '<div class="chat-msg-content">'.
+    data = b'<div class="chat-msg">a</div><div class="chat-msg-content">b</div><div class="chat-msg">c</div>'
+    cut = data.index(b'-content')
+    pieces = list(split_pieces([data[:cut], data[cut:]], _CONTAINER_START_RES['discord'], 1))
+    assert pieces == [b'<div class="chat-msg">a</div><div class="chat-msg-content">b</div>',
+                      b'<div class="chat-msg">c</div>']
+
+
+@pytest.mark.parametrize('platform', sorted(CONTAINER_CLASSES))
+def test_pieces_start_at_containers_whatever_the_block_size(platform, lookalike_text):
+    data = generators.generate_export(platform, 20, seed=1)
+    starts = _starts(data, platform)
+    assert len(starts) == 20
+    pattern = _CONTAINER_START_RES[platform]
+    for size in list(range(1, 64)) + [97, 333, 997, 4096]:
+        pieces = list(split_pieces(_blocks(data, size), pattern, size))
+        assert b''.join(pieces) == data
+        offset = len(pieces[0])
+        for piece in pieces[1:]:
+            assert offset in starts, (size, piece[:40])
+            offset += len(piece)
+
+
+def _extract(data: bytes, filename: str, monkeypatch, chunk_bytes: int = None) -> list:
+    monkeypatch.setattr(Config, 'CHUNKED_PARSE_BYTES', chunk_bytes or 0)
+    if chunk_bytes:
+        monkeypatch.setattr(Config, 'CHUNK_BYTES', chunk_bytes)
+    file_obj = io.BytesIO(data)
+    file_obj.filename = filename
+    file_obj.file_size = len(data)
+    return [msg.to_dict() for msg in extract_messages(file_obj)]
+
+
+@pytest.mark.parametrize('platform', sorted(CONTAINER_CLASSES))
+def test_pieces_parse_like_the_whole_tree(platform, lookalike_text, monkeypatch, capsys):
+    data = generators.generate_export(platform, 300, seed=2)
+    filename = generators.export_filename(platform)
+    whole = _extract(data, filename, monkeypatch)
+    assert len(whole) == 300
+    # Pieces big enough for the platform to be recognised from the first one.
+    for chunk_bytes in (997, 4096, 20000):
+        capsys.readouterr()
+        assert _extract(data, filename, monkeypatch, chunk_bytes) == whole, chunk_bytes
+        assert '(parsed in pieces)' in capsys.readouterr().out
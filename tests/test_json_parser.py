@@ -0,0 +1,98 @@
+# The incremental JSON reader against json.loads, with the input cut at every
+# byte offset: inside strings, escapes, multi-byte characters, numbers and
+# literals, and between the levels of nested arrays and objects.
+
+import io
+import json
+
+import pytest
+
+from app.parsers.json_parser import _JsonStream, iter_generic_json, parse_generic_json
+
+
+class _SplitReader:
+    """A file whose first read() stops at byte `cut`; later reads return `step` bytes at most."""
+
+    def __init__(self, data: bytes, cut: int, step: int = None):
+        self._data = data
+        self._pos = 0
+        self._cut = cut
+        self._step = step
+
+    def read(self, size=-1):
+        end = len(self._data)
+        if self._pos < self._cut:
+            end = self._cut
+        elif self._step:
+            end = min(end, self._pos + self._step)
+        chunk = self._data[self._pos:end]
+        self._pos = end
+        return chunk
+
+
+MESSAGE = {"sender": "Dara", "message": "ស្អែក \"see\" you\\n 😀", "timestamp": "2021-03-01 10:00:00"}
+
+DOCUMENTS = {
+    'strings': ['plain', 'quote " inside', 'back\\slash', 'tab\tnew\nline', 'é ü 中文 😀', '\u0000 \u001f', ''],
+    'numbers': [0, -0, 1, -1, 1.5, -0.25, 1e10, 1.5e+300, -2.5E-7, 12345678901234567890, 0.1, 10.0],
+    'literals': [True, False, None, [True, [False, [None]]]],
+    'nested': {"a": [1, [2.5, [3e3, {"b": {"c": [[], {}, [{}], "d"]}}]]], "e": {"f": {"g": -4.25}}},
+    'messages': {"meta": {"version": 1.5, "count": 2, "tags": ["x", {"y": [1.25]}]},
+                 "messages": [MESSAGE, dict(MESSAGE, message="second"), 3.75, None],
+                 "after": [1e-3]},
+    'single_message': {"timestamp": "2021-03-01T10:00:00", "author": {"name": "Dara", "id": 12345},
+                       "content": "hi \\ \"there\"", "score": -12.5e-3, "edited": None},
+}
+
+
+def _encodings(value):
+    yield json.dumps(value).encode('utf-8')  # \u escapes
+    yield json.dumps(value, ensure_ascii=False).encode('utf-8')  # raw multi-byte characters
+    yield json.dumps(value, ensure_ascii=False, indent=2).encode('utf-8')  # whitespace between tokens
+
+
+@pytest.mark.parametrize('name', DOCUMENTS)
+def test_value_matches_json_loads_at_every_cut(name):
+    for data in _encodings(DOCUMENTS[name]):
+        expected = json.loads(data)
+        for cut in range(len(data) + 1):
+            stream = _JsonStream(_SplitReader(data, cut))
+            assert stream.value() == expected, (data, cut)
+            stream.expect_end()
+
+
+@pytest.mark.parametrize('name', DOCUMENTS)
+def test_value_matches_json_loads_one_byte_at_a_time(name):
+    for data in _encodings(DOCUMENTS[name]):
+        stream = _JsonStream(_SplitReader(data, 0, step=1), chunk_size=1)
+        assert stream.value() == json.loads(data)
+        stream.expect_end()
+
+
+@pytest.mark.parametrize('name', ['messages', 'single_message', 'nested', 'strings'])
+def test_messages_match_parse_generic_json_at_every_cut(name):
+    for data in _encodings(DOCUMENTS[name]):
+        expected = [msg.to_dict() for msg in parse_generic_json(json.loads(data))]
+        for cut in range(len(data) + 1):
+            got = [msg.to_dict() for msg in iter_generic_json(_SplitReader(data, cut, step=7))]
+            assert got == expected, (data, cut)
+
+
+@pytest.mark.parametrize('number, cut_after', [('1.5', '1.'), ('1e5', '1e'), ('1E+5', '1E+'),
+                                               ('-2.5e-3', '-2.'), ('-2.5e-3', '-2.5e-')])
+def test_number_cut_at_the_default_chunk_size(number, cut_after):
+    # The first 64 KiB read ends inside the number, right after `cut_after`.
+    head = '{"meta": {"x": "'
+    before = '"}, "version": '
+    pad = (1 << 16) - len(head) - len(before) - len(cut_after)
+    data = (head + 'y' * pad + before + number + ', "messages": [' + json.dumps(MESSAGE) + ']}').encode('utf-8')
+    assert data[:1 << 16].endswith(cut_after.encode())
+    expected = [msg.to_dict() for msg in parse_generic_json(json.loads(data))]
+    assert [msg.to_dict() for msg in iter_generic_json(io.BytesIO(data))] == expected
+
+
+@pytest.mark.parametrize('data', [b'{"a": 1,}', b'[1 2]', b'{"a" 1}', b'[1, 2', b'"open', b'[1] [2]', b'{"a": 1.}'])
+def test_invalid_documents_raise(data):
+    for cut in range(len(data) + 1):
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_generic_json(_SplitReader(data, cut)))